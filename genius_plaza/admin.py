@@ -1,9 +1,11 @@
 from django.contrib import admin, messages
 from django.conf.urls import url
 from django.contrib.admin.options import IS_POPUP_VAR
+from django.contrib.admin.views.main import SEARCH_VAR
 from django.contrib.admin.utils import unquote
 from django.contrib.auth.models import User as AuthUser, Group as AuthGroup
 from django.core.exceptions import PermissionDenied
+from django.db.models import Prefetch
 from django.http import Http404, HttpResponseRedirect
 from django.template.response import TemplateResponse
 from django.urls import reverse
@@ -11,7 +13,10 @@ from django.utils.encoding import force_text
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
 from . import forms
+from . import fulltext
 from . import models
+from . import pagination
+from . import search
 
 admin.site.unregister(AuthUser)
 admin.site.unregister(AuthGroup)
@@ -33,6 +38,8 @@ class UserAdmin(admin.ModelAdmin):
     ordering = ('first_name', 'last_name')
     search_fields = ('first_name', 'last_name', 'username', 'email')
     readonly_fields = ('created', 'modified')
+    paginator = pagination.EstimatedCountPaginator
+    show_full_result_count = False
 
     def list_display_full_name(self, obj):
         return '%s %s' % (obj.first_name, obj.last_name)
@@ -150,8 +157,17 @@ class RecipeAdmin(admin.ModelAdmin):
     actions_selection_counter = True
     ordering = ('name',)
     search_fields = ('name',)
-    # raw_id_fields = ('user',)
-    filter_horizontal = ('steps', 'ingredients')
+    # Lookup popups instead of select widgets holding every user, step and ingredient in the database.
+    raw_id_fields = ('user', 'steps', 'ingredients')
+    paginator = pagination.EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # The changelist shows the user, steps and ingredients of every row: one join and two prefetch queries per page instead of three queries per row.
+        return super(RecipeAdmin, self).get_queryset(request).select_related('user').prefetch_related(
+            Prefetch('steps', queryset=models.Step.objects.only('id', 'step_text')),
+            Prefetch('ingredients', queryset=models.Ingredient.objects.only('id', 'text')),
+        )
 
     def list_display_user(self, obj):
         if obj.user is None:
@@ -159,6 +175,30 @@ class RecipeAdmin(admin.ModelAdmin):
         else:
             return obj.user
 
+    def get_fulltext_backend(self, search_term):
+        # None for an empty or unparsable term, or a database without full-text support: the changelist then uses the plain name search.
+        backend = fulltext.get_backend()
+        if search_term.strip() == '' or backend is None:
+            return None
+        try:
+            backend.get_match(search.parse_query(search_term))
+        except ValueError:
+            return None
+        return backend
+
+    def get_ordering(self, request):
+        # The changelist re-orders after searching: keep the relevance order of a full-text search.
+        backend = self.get_fulltext_backend(request.GET.get(SEARCH_VAR, ''))
+        if backend is not None:
+            return (backend.ordering,)
+        return super(RecipeAdmin, self).get_ordering(request)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Ranked full-text match over name, steps and ingredients instead of LIKE '%term%' on the name.
+        if self.get_fulltext_backend(search_term) is None:
+            return super(RecipeAdmin, self).get_search_results(request, queryset, search_term)
+        return fulltext.search_recipes(queryset, search_term), False
+
     def list_display_steps(self, obj):
         data = [str(q) for q in obj.steps.all()]
         if len(data) == 0:
@@ -178,6 +218,7 @@ class RecipeAdmin(admin.ModelAdmin):
 
 @admin.register(models.Step)
 class StepAdmin(admin.ModelAdmin):
+    form = forms.NormalizedTextForm
     list_display = ('step_text',)
     list_display_links = ('step_text',)
     list_per_page = 10
@@ -187,9 +228,14 @@ class StepAdmin(admin.ModelAdmin):
     ordering = ('step_text',)
     search_fields = ('step_text',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Prefix match on the indexed normalized column instead of LIKE '%term%' over every row.
+        return queryset.filter_text_prefix(search_term), False
+
 
 @admin.register(models.Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
+    form = forms.NormalizedTextForm
     list_display = ('text',)
     list_display_links = ('text',)
     list_per_page = 10
@@ -198,3 +244,7 @@ class IngredientAdmin(admin.ModelAdmin):
     actions_selection_counter = True
     ordering = ('text',)
     search_fields = ('text',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Prefix match on the indexed normalized column instead of LIKE '%term%' over every row.
+        return queryset.filter_text_prefix(search_term), False
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class GeniusPlazaConfig(AppConfig):
     name = 'genius_plaza'
     verbose_name = 'Genius Plaza'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (connects the receivers)
+        from . import passwords
+        # Calibrates the hashing cost (TARGET_TIME) now rather than in the first request that hashes or verifies a password.
+        passwords.get_config()
@@ -0,0 +1,270 @@
+import bisect
+import heapq
+import itertools
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+from . import bulk, models
+
+DEFAULTS = {
+    # Seconds before an index is rebuilt from the database: signals keep it current for writes made by this process, the rebuild picks up the
+    # writes of the others and recipe counts that went down (removed relations and deleted recipes are not tracked incrementally).
+    'TTL': 300,
+    # Suggestions returned when ?limit= is not given, and the most a request may ask for.
+    'LIMIT': 10,
+    'MAX_LIMIT': 50,
+    # Ranked prefixes memoized per index; the memo is dropped when it grows past this.
+    'MAX_MEMO': 10000,
+}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_rebuilding = set()
+
+logger = logging.getLogger(__name__)
+
+
+def get_setting(name):
+    return getattr(settings, 'GENIUS_PLAZA_AUTOCOMPLETE', {}).get(name, DEFAULTS[name])
+
+
+def normalize(text):
+    return models.normalize_text(text)
+
+
+class PrefixIndex(object):
+    # Sorted (normalized text, pk) keys of one model, with each item's text and popularity (the recipes referencing it). A prefix is the key range
+    # [prefix, prefix_upper_bound(prefix)), found with two bisections; its ranked top is memoized, and patched or dropped as items under it change.
+    def __init__(self, source):
+        self.source = source
+        self.lock = threading.RLock()
+        self.keys = []
+        self.texts = {}
+        self.popularity = {}
+        self.memo = {}
+        self.built = None
+
+    def build(self):
+        texts, popularity = self.source.load()
+        keys = sorted((normalize(text), pk) for pk, text in texts.items())
+        memo = {}
+        # One-character prefixes match the most items: ranked up front, in one pass, so no request pays for them.
+        for first, group in itertools.groupby(keys, key=lambda key: key[0][:1]):
+            memo[first] = [pk for text, pk in heapq.nsmallest(get_setting('MAX_LIMIT'), group, key=lambda key: (-popularity.get(key[1], 0), key))]
+        with self.lock:
+            self.keys, self.texts, self.popularity, self.memo = keys, texts, popularity, memo
+            self.built = time.monotonic()
+
+    def is_stale(self):
+        return self.built is None or time.monotonic() - self.built > get_setting('TTL')
+
+    def rank_key(self, pk):
+        return (-self.popularity.get(pk, 0), (normalize(self.texts[pk]), pk))
+
+    def forget(self, text):
+        # Something under these prefixes lost rank or went away: the next item in line is unknown, so their tops are ranked again when asked for.
+        for end in range(len(text) + 1):
+            self.memo.pop(text[:end], None)
+
+    def promote(self, text, pk):
+        # pk is new or gained rank: it can only move up in the memoized tops of its prefixes, which are patched in place.
+        limit = get_setting('MAX_LIMIT')
+        for end in range(len(text) + 1):
+            top = self.memo.get(text[:end])
+            if top is None:
+                continue
+            if pk not in top:
+                if len(top) >= limit and self.rank_key(pk) > self.rank_key(top[-1]):
+                    continue
+                top.append(pk)
+            top.sort(key=self.rank_key)
+            del top[limit:]
+
+    def update(self, pk, text=None, popularity=None):
+        with self.lock:
+            old_text = self.texts.get(pk)
+            old_popularity = self.popularity.get(pk, 0)
+            if text is not None and text != old_text:
+                if old_text is not None:
+                    self.discard_key((normalize(old_text), pk))
+                key = (normalize(text), pk)
+                bisect.insort(self.keys, key)
+                self.texts[pk] = text
+            if pk not in self.texts:
+                return
+            if popularity is not None:
+                self.popularity[pk] = popularity
+            if self.popularity.get(pk, 0) >= old_popularity:
+                self.promote(normalize(self.texts[pk]), pk)
+            else:
+                self.forget(normalize(self.texts[pk]))
+
+    def remove(self, pk):
+        with self.lock:
+            text = self.texts.pop(pk, None)
+            self.popularity.pop(pk, None)
+            if text is not None:
+                self.discard_key((normalize(text), pk))
+
+    def discard_key(self, key):
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+        self.forget(key[0])
+
+    def search(self, prefix, limit):
+        # [(pk, text, popularity)], most popular first, then in text order.
+        prefix = normalize(prefix)
+        with self.lock:
+            top = self.memo.get(prefix)
+            if top is None:
+                top = self.rank(prefix, get_setting('MAX_LIMIT'))
+                if len(self.memo) >= get_setting('MAX_MEMO'):
+                    self.memo = {}
+                self.memo[prefix] = top
+            return [(pk, self.texts[pk], self.popularity.get(pk, 0)) for pk in top[:limit]]
+
+    def rank(self, prefix, limit):
+        start = bisect.bisect_left(self.keys, (prefix,))
+        if prefix:
+            end = bisect.bisect_left(self.keys, (models.prefix_upper_bound(prefix),), start)
+        else:
+            end = len(self.keys)
+        popularity = self.popularity
+        keys = (self.keys[position] for position in range(start, end))
+        return [pk for text, pk in heapq.nsmallest(limit, keys, key=lambda key: (-popularity.get(key[1], 0), key))]
+
+
+class RelatedSource(object):
+    # Steps or ingredients, ranked by the recipes linking them through the Recipe.<name> table.
+    def __init__(self, name, model, text_field):
+        self.name = name
+        self.model = model
+        self.text_field = text_field
+        self.through = getattr(models.Recipe, name).through
+        self.column = '%s_id' % model._meta.model_name
+
+    def load(self):
+        texts = dict(self.model.objects.order_by().values_list('pk', self.text_field).iterator())
+        popularity = dict(self.through.objects.order_by().values(self.column).annotate(count=Count('pk')).values_list(self.column, 'count'))
+        return texts, popularity
+
+    def changed_items(self, recipe_ids, fields):
+        # {pk: (text, popularity)} of the items the given recipes link now.
+        if self.name not in fields:
+            return {}
+        result = {}
+        for batch in bulk.chunks(recipe_ids):
+            pks = set(self.through.objects.filter(recipe_id__in=batch).values_list(self.column, flat=True))
+            for pks_batch in bulk.chunks(pks):
+                counts = dict(self.through.objects.filter(**{self.column + '__in': pks_batch}).order_by().values(self.column).annotate(
+                    count=Count('pk')
+                ).values_list(self.column, 'count'))
+                for pk, text in self.model.objects.filter(pk__in=pks_batch).values_list('pk', self.text_field):
+                    result[pk] = (text, counts.get(pk, 0))
+        return result
+
+
+class UserSource(object):
+    # Users by username, ranked by the recipes they own.
+    model = models.User
+    text_field = 'username'
+
+    def load(self):
+        texts = dict(models.User.objects.order_by().values_list('pk', 'username').iterator())
+        popularity = dict(models.Recipe.objects.order_by().values('user_id').annotate(count=Count('pk')).values_list('user_id', 'count'))
+        return texts, popularity
+
+    def changed_items(self, recipe_ids, fields):
+        if 'user' not in fields:
+            return {}
+        result = {}
+        for batch in bulk.chunks(recipe_ids):
+            pks = set(models.Recipe.objects.filter(pk__in=batch, user__isnull=False).values_list('user_id', flat=True))
+            counts = dict(models.Recipe.objects.filter(user_id__in=pks).order_by().values('user_id').annotate(
+                count=Count('pk')
+            ).values_list('user_id', 'count'))
+            for pk, username in models.User.objects.filter(pk__in=pks).values_list('pk', 'username'):
+                result[pk] = (username, counts.get(pk, 0))
+        return result
+
+
+SOURCES = {
+    'steps': RelatedSource('steps', models.Step, 'step_text'),
+    'ingredients': RelatedSource('ingredients', models.Ingredient, 'text'),
+    'users': UserSource(),
+}
+
+
+def get_index(name):
+    # Built on first use in each process. Once older than TTL it is rebuilt in a background thread while requests keep reading it; the new
+    # index replaces it when complete.
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None:
+            index = _indexes[name] = PrefixIndex(SOURCES[name])
+        elif index.built is not None and index.is_stale() and name not in _rebuilding:
+            _rebuilding.add(name)
+            threading.Thread(target=rebuild, args=(name, index), name='autocomplete-%s' % name, daemon=True).start()
+    with index.lock:
+        if index.built is None:
+            index.build()
+    return index
+
+
+def rebuild(name, index):
+    try:
+        new_index = PrefixIndex(index.source)
+        new_index.build()
+        # Writes signalled while it loaded went to the old index only; the next rebuild picks them up from the database.
+        with _indexes_lock:
+            if _indexes.get(name) is index:
+                _indexes[name] = new_index
+    except Exception:
+        logger.exception('Rebuilding the %s autocomplete index failed', name)
+    finally:
+        with _indexes_lock:
+            _rebuilding.discard(name)
+        connections.close_all()
+
+
+def get_built_indexes(model=None):
+    # Only indexes this process has built are kept current: the others load everything when first used anyway.
+    return [(name, index) for name, index in list(_indexes.items()) if index.built is not None and (model is None or index.source.model is model)]
+
+
+def suggest(name, prefix, limit=None):
+    limit = min(limit or get_setting('LIMIT'), get_setting('MAX_LIMIT'))
+    return get_index(name).search(prefix, limit)
+
+
+def item_saved(model, instance):
+    for name, index in get_built_indexes(model):
+        index.update(instance.pk, text=getattr(instance, index.source.text_field))
+
+
+def items_saved(model, pks):
+    # Rows written with bulk INSERT/UPDATE (no post_save).
+    for name, index in get_built_indexes(model):
+        for batch in bulk.chunks(pks):
+            for pk, text in model.objects.filter(pk__in=batch).values_list('pk', index.source.text_field):
+                index.update(pk, text=text)
+
+
+def item_deleted(model, pk):
+    for name, index in get_built_indexes(model):
+        index.remove(pk)
+
+
+def recipes_changed(recipe_ids, fields):
+    for name, index in get_built_indexes():
+        for pk, (text, popularity) in index.source.changed_items(recipe_ids, fields).items():
+            index.update(pk, text=text, popularity=popularity)
+
+
+def reset():
+    with _indexes_lock:
+        _indexes.clear()
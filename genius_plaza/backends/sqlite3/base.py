@@ -0,0 +1,39 @@
+from django.db.backends.sqlite3 import base
+
+# Run on every new connection; DATABASES[alias]['OPTIONS']['pragmas'] overrides them one by one. WAL lets readers run alongside the writer,
+# busy_timeout (ms) makes a blocked writer wait instead of failing, synchronous=NORMAL only syncs at checkpoints (durable enough with WAL) and
+# mmap_size (bytes) reads the file through a memory mapping instead of read() calls.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('busy_timeout', 5000),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 268435456),
+)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # django.db.backends.sqlite3 tuned for concurrent writers. Besides the PRAGMAs, the outermost bulk.atomic_write() block starts with BEGIN
+    # IMMEDIATE: a transaction that reads before it writes takes the write lock up front and waits its turn on busy_timeout, where a deferred
+    # BEGIN fails with "database is locked" when two of them try to upgrade their read locks at once. Every other transaction, read-only ones
+    # included, keeps Django's deferred BEGIN and does not queue behind writers. OPTIONS 'transaction_mode' forces one mode for all of them.
+    immediate_transaction = False
+
+    def get_connection_params(self):
+        kwargs = super(DatabaseWrapper, self).get_connection_params()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        pragmas = dict(PRAGMAS)
+        pragmas.update(self.settings_dict['OPTIONS'].get('pragmas', {}))
+        for name, value in pragmas.items():
+            conn.execute('PRAGMA %s = %s' % (name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is None:
+            mode = 'IMMEDIATE' if self.immediate_transaction else 'DEFERRED'
+        self.cursor().execute('BEGIN %s' % mode)
@@ -0,0 +1,533 @@
+import contextlib
+import gzip
+import io
+import json
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent import futures
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from passlib import registry
+from rest_framework.renderers import JSONRenderer
+from . import bulk, cache, export, instrumentation, middleware, models, pagination, passwords, renderers, rows, serializers
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+
+    return decorator
+
+
+@contextlib.contextmanager
+def test_database(verbosity=0):
+    # Benchmarks never touch the configured databases: they run against a throw-away test database (replicas off), with DEBUG off so queries are
+    # not logged.
+    # On SQLite the test database is a temporary file rather than shared-cache memory, which cannot take concurrent writers.
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST'].get('NAME')
+    if connection.vendor == 'sqlite' and not old_test_name:
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'genius_plaza_benchmark.sqlite3')
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        with override_settings(DEBUG=False, DATABASE_REPLICAS=[]):
+            yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+
+
+def post_json(client, url, data):
+    return client.generic('POST', url, json.dumps(data), content_type='application/json', HTTP_ACCEPT='application/json')
+
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+
+def peak_rss():
+    # KB on Linux; the process high-water mark, so a measurement only shows growth over what ran before it.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def seed_recipes(count, users=10, steps=50, ingredients=50, steps_per_recipe=5, ingredients_per_recipe=4):
+    # count recipes written with the bulk helpers (no per-row signals), each linked to a few of the seeded users, steps and ingredients.
+    with transaction.atomic():
+        user_objs = bulk.bulk_create(models.User, [
+            models.User(first_name='First %s' % i, last_name='Last %s' % i, email='seed%s@example.com' % i, username='seed_%s' % i, password='!')
+            for i in range(users)
+        ])
+        step_objs = bulk.bulk_create(models.Step, [models.Step(step_text='Step %s' % i) for i in range(steps)])
+        ingredient_objs = bulk.bulk_create(models.Ingredient, [models.Ingredient(text='Ingredient %s' % i) for i in range(ingredients)])
+        for offset in range(0, count, 10000):
+            recipes = bulk.bulk_create(models.Recipe, [
+                models.Recipe(name='Recipe %s' % i, user=user_objs[i % users]) for i in range(offset, min(offset + 10000, count))
+            ])
+            bulk.bulk_add_m2m(models.Recipe, 'steps', [
+                (recipe.pk, step_objs[(recipe.pk + j) % steps].pk) for recipe in recipes for j in range(steps_per_recipe)
+            ])
+            bulk.bulk_add_m2m(models.Recipe, 'ingredients', [
+                (recipe.pk, ingredient_objs[(recipe.pk + j) % ingredients].pk) for recipe in recipes for j in range(ingredients_per_recipe)
+            ])
+
+
+def index_recipes():
+    # seed_recipes() bypasses the signals: build the ingredient term and full-text indexes the search endpoints read.
+    call_command('rebuild_ingredient_index', stdout=io.StringIO())
+    call_command('rebuild_fulltext_index', stdout=io.StringIO())
+
+
+def percentile(values, percent):
+    # Nearest-rank percentile of a sorted list.
+    if len(values) == 0:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(percent / 100.0 * len(values))) - 1))]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+SERVER_TIMING_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def wsgi_request(application, method, path, body=None):
+    # One request through the WSGI callable the way a server makes it: (status, headers, body size). The query count comes from the Server-Timing
+    # header of InstrumentationMiddleware (None when it is disabled).
+    path, _, query_string = path.partition('?')
+    body = b'' if body is None else json.dumps(body).encode('utf-8')
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query_string,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'HTTP_ACCEPT': 'application/json',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = dict(headers)
+
+    result = application(environ, start_response)
+    try:
+        size = sum(len(data) for data in result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    match = SERVER_TIMING_QUERIES_RE.search(response['headers'].get('Server-Timing', ''))
+    return response['status'], int(match.group(1)) if match else None, size
+
+
+def get_api_endpoints():
+    # (name, method, build(i) -> (path, JSON body)) for every route of genius_plaza/urls.py, on seeded data. Reads first, then writes, deletes last.
+    users = list(models.User.objects.order_by('pk').values_list('pk', 'username')[:100])
+    recipes = list(models.Recipe.objects.order_by('pk').values_list('pk', flat=True))
+    steps = list(models.Step.objects.order_by('pk').values_list('pk', flat=True)[:100])
+    ingredients = list(models.Ingredient.objects.order_by('pk').values_list('pk', flat=True)[:100])
+
+    def url(name, **kwargs):
+        return reverse('genius-plaza:%s' % name, kwargs=kwargs or None)
+
+    def pick(items, i):
+        return items[i % len(items)]
+
+    def recipe_data(i):
+        return {'name': 'Load recipe %s' % i, 'user': pick(users, i)[0], 'steps': [pick(steps, i)], 'ingredients': [pick(ingredients, i), pick(ingredients, i + 1)]}
+
+    return [
+        ('users-list', 'GET', lambda i: (url('users-list') + '?page=%s' % (i % 2 + 1), None)),
+        ('users-detail', 'GET', lambda i: (url('users-detail', pk=pick(users, i)[0]), None)),
+        ('users-autocomplete', 'GET', lambda i: (url('users-autocomplete') + '?q=%s' % pick(users, i)[1][:6], None)),
+        ('recipes-list', 'GET', lambda i: (url('recipes-list') + '?page=%s' % (i % 20 + 1), None)),
+        ('recipes-list-search', 'GET', lambda i: (url('recipes-list') + '?search=recipe+%s' % (i % 100), None)),
+        ('recipes-detail', 'GET', lambda i: (url('recipes-detail', pk=pick(recipes, i)), None)),
+        ('recipes-search', 'GET', lambda i: (url('recipes-search') + '?q=ingredient+%s' % (i % 50), None)),
+        ('steps-list', 'GET', lambda i: (url('steps-list') + '?page=%s' % (i % 10 + 1), None)),
+        ('steps-detail', 'GET', lambda i: (url('steps-detail', pk=pick(steps, i)), None)),
+        ('steps-autocomplete', 'GET', lambda i: (url('steps-autocomplete') + '?q=step+%s' % (i % 10), None)),
+        ('ingredients-list', 'GET', lambda i: (url('ingredients-list') + '?page=%s' % (i % 10 + 1), None)),
+        ('ingredients-detail', 'GET', lambda i: (url('ingredients-detail', pk=pick(ingredients, i)), None)),
+        ('ingredients-autocomplete', 'GET', lambda i: (url('ingredients-autocomplete') + '?q=ingredient+%s' % (i % 10), None)),
+        ('recipe-list', 'GET', lambda i: (url('recipe-list') + '?page=%s' % (i % 20 + 1), None)),
+        ('recipe-detail', 'GET', lambda i: (url('recipe-detail', pk=pick(recipes, i)), None)),
+        ('recipe-by-user-pk', 'GET', lambda i: (url('recipe-by-user-pk', pk=pick(users, i)[0]), None)),
+        ('recipe-by-user-username', 'GET', lambda i: (url('recipe-by-user-username', username=pick(users, i)[1]), None)),
+        ('recipe-export', 'GET', lambda i: (url('recipe-export') + '?format=%s' % pick(export.FORMATS, i), None)),
+        ('cache-stats', 'GET', lambda i: (url('cache-stats'), None)),
+        ('metrics', 'GET', lambda i: (url('metrics'), None)),
+        ('users-create', 'POST', lambda i: (url('users-list'), {
+            'username': 'load_%s' % i, 'email': 'load%s@example.com' % i, 'password': 'password', 'password_confirmation': 'password', 'is_active': True,
+        })),
+        ('recipe-create', 'POST', lambda i: (url('recipe-create'), recipe_data(i))),
+        ('recipes-bulk', 'POST', lambda i: (url('recipes-bulk'), [recipe_data(i * 10 + j) for j in range(10)])),
+        ('recipe-update', 'PATCH', lambda i: (url('recipe-update', pk=pick(recipes, i)), {'name': 'Renamed recipe %s' % i})),
+        ('recipes-detail-update', 'PUT', lambda i: (url('recipes-detail', pk=pick(recipes, i + 1)), recipe_data(i))),
+        # Seeded recipes from the end of the catalog, a different one per request (as long as --requests <= --count).
+        ('recipe-delete', 'DELETE', lambda i: (url('recipe-delete', pk=recipes[-1 - i % len(recipes)]), None)),
+    ]
+
+
+@scenario('bulk')
+def bulk_write(count=1000, batch_size=1000, **options):
+    # Per-object POSTs to the router endpoints versus POSTs of batch_size items to <list>/bulk/.
+    client = Client()
+    seeded = 10
+    models.Step.objects.bulk_create([models.Step(step_text='Step %s' % i) for i in range(seeded)])
+    models.Ingredient.objects.bulk_create([models.Ingredient(text='Ingredient %s' % i) for i in range(seeded)])
+    step_pks = list(models.Step.objects.values_list('pk', flat=True))
+    ingredient_pks = list(models.Ingredient.objects.values_list('pk', flat=True))
+    payloads = (
+        ('steps', models.Step, lambda i: {'step_text': 'Step %s' % i}),
+        ('ingredients', models.Ingredient, lambda i: {'text': 'Ingredient %s' % i}),
+        ('recipes', models.Recipe, lambda i: {'name': 'Recipe %s' % i, 'steps': step_pks[i % 3:i % 3 + 5], 'ingredients': ingredient_pks[i % 4:i % 4 + 4]}),
+    )
+    results = {}
+    for basename, model, payload in payloads:
+        # Steps and ingredients are deduplicated on their normalized text: each phase posts texts not stored yet (past the seeded ones and the
+        # other phase's), so both insert count new rows instead of the bulk phase looking up what the per-object one created.
+        rows = model.objects.count()
+        start = time.perf_counter()
+        for i in range(count):
+            response = post_json(client, reverse('genius-plaza:%s-list' % basename), payload(seeded + i))
+            assert response.status_code == 201, response.content
+        per_object = time.perf_counter() - start
+        assert model.objects.count() == rows + count
+        items = [payload(seeded + count + i) for i in range(count)]
+        start = time.perf_counter()
+        for offset in range(0, count, batch_size):
+            response = post_json(client, reverse('genius-plaza:%s-bulk' % basename), items[offset:offset + batch_size])
+            assert response.status_code == 201, response.content
+        bulk = time.perf_counter() - start
+        assert model.objects.count() == rows + 2 * count
+        results[basename] = {
+            'count': count,
+            'per_object_seconds': round(per_object, 4),
+            'per_object_per_second': rate(count, per_object),
+            'bulk_seconds': round(bulk, 4),
+            'bulk_per_second': rate(count, bulk),
+            'speedup': round(per_object / bulk, 1) if bulk else None,
+        }
+    return results
+
+
+@scenario('user_create')
+def user_create(count=1000, concurrency=8, **options):
+    # POST /genius-plaza/users/ from concurrency threads, hashing in the request thread (WORKERS 0) versus in the process pool.
+    results = {}
+    for label, workers in (('inline', 0), ('pool', max(passwords.get_setting('WORKERS'), 1))):
+        hashing = dict(passwords.DEFAULTS, **getattr(settings, 'GENIUS_PLAZA_PASSWORD_HASHING', {}))
+        hashing['WORKERS'] = workers
+        with override_settings(GENIUS_PLAZA_PASSWORD_HASHING=hashing):
+            passwords.shutdown()
+            passwords.hash_password('warm up')
+            latencies = []
+
+            def create(i):
+                client = Client()
+                start = time.perf_counter()
+                response = post_json(client, reverse('genius-plaza:users-list'), {
+                    'first_name': 'First', 'last_name': 'Last', 'email': '%s-%s@example.com' % (label, i), 'username': '%s_%s' % (label, i),
+                    'password': 'password %s' % i, 'password_confirmation': 'password %s' % i, 'is_active': True,
+                })
+                assert response.status_code == 201, response.content
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(create, range(count)))
+            seconds = time.perf_counter() - start
+            passwords.shutdown()
+        latencies.sort()
+        results[label] = {
+            'count': count,
+            'concurrency': concurrency,
+            'workers': workers,
+            'seconds': round(seconds, 4),
+            'per_second': rate(count, seconds),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+        }
+    return results
+
+
+@scenario('hashers')
+def hashers(count=1000, **options):
+    # Verify latency per configured scheme on this host (at most 50 verifications per cost), at passlib's default cost and at the configured / calibrated cost.
+    count = min(count, 50)
+    _schemes, _default, rounds = passwords.get_config()
+    rounds = dict(rounds)
+    available = passwords.get_available_schemes()
+    results = {}
+    for name in passwords.get_setting('SCHEMES'):
+        if name not in available:
+            results[name] = {'available': False}
+            continue
+        handler = registry.get_crypt_handler(name)
+        result = {'available': True}
+        for label, cost in (('default', getattr(handler, 'default_rounds', None)), ('configured', rounds.get(name, getattr(handler, 'default_rounds', None)))):
+            hasher = handler.using(rounds=cost) if cost is not None else handler
+            hash = hasher.hash('benchmark password')
+            latencies = []
+            for i in range(count):
+                start = time.perf_counter()
+                assert handler.verify('benchmark password', hash)
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            result[label] = {
+                'rounds': cost,
+                'verify_p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+                'verify_max_ms': round(latencies[-1] * 1000, 2),
+            }
+        results[name] = result
+    results['target_time_ms'] = passwords.get_setting('TARGET_TIME') and passwords.get_setting('TARGET_TIME') * 1000
+    return results
+
+
+@scenario('export')
+def export_recipes(count=1000, batch_size=1000, **options):
+    # Streaming export (command path and HTTP path) against serializing the whole catalog at once, which runs last since RSS is a high-water mark.
+    seed_recipes(count)
+    results = {}
+    for format in export.FORMATS:
+        rss = peak_rss()
+        start = time.perf_counter()
+        size = 0
+        for data in export.export_recipes(format, chunk_size=batch_size):
+            size += len(data)
+        seconds = time.perf_counter() - start
+        results[format] = {
+            'rows': count,
+            'bytes': size,
+            'seconds': round(seconds, 4),
+            'rows_per_second': rate(count, seconds),
+            'peak_rss_kb': peak_rss(),
+            'rss_growth_kb': peak_rss() - rss,
+        }
+    rss = peak_rss()
+    start = time.perf_counter()
+    response = Client().get(reverse('genius-plaza:recipe-export') + '?format=ndjson')
+    size = sum(len(data) for data in response.streaming_content)
+    seconds = time.perf_counter() - start
+    results['http_ndjson'] = {
+        'rows': count,
+        'bytes': size,
+        'seconds': round(seconds, 4),
+        'rows_per_second': rate(count, seconds),
+        'rss_growth_kb': peak_rss() - rss,
+    }
+    rss = peak_rss()
+    start = time.perf_counter()
+    data = serializers.RecipeReadSerializer(models.Recipe.objects.get_recipes(), many=True).data
+    size = len(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    seconds = time.perf_counter() - start
+    results['materialized'] = {
+        'rows': len(data),
+        'bytes': size,
+        'seconds': round(seconds, 4),
+        'rows_per_second': rate(len(data), seconds),
+        'rss_growth_kb': peak_rss() - rss,
+    }
+    return results
+
+
+@scenario('instrumentation')
+def instrumentation_overhead(count=1000, **options):
+    # The same GETs through the whole middleware stack with InstrumentationMiddleware enabled and disabled, in interleaved rounds so that drift
+    # (caches warming, the OS) hits both sides alike. A cached list, an uncached list and a detail keep the request mix realistic.
+    seed_recipes(min(count, 1000))
+    user = models.User.objects.order_by('pk').first()
+    urls = [
+        reverse('genius-plaza:recipes-list') + '?page_size=20',
+        reverse('genius-plaza:steps-list') + '?page_size=20',
+        reverse('genius-plaza:recipe-by-user-pk', kwargs={'pk': user.pk}) + '?page_size=20',
+        reverse('genius-plaza:recipe-detail', kwargs={'pk': models.Recipe.objects.order_by('pk').first().pk}),
+    ]
+    client = Client()
+    cache.get_cache().clear()
+    for url in urls:
+        client.get(url, HTTP_ACCEPT='application/json')
+    rounds = 20
+    per_round = max(count // rounds, len(urls))
+    timings = {False: [], True: []}
+    for number in range(rounds):
+        for enabled in ((False, True) if number % 2 == 0 else (True, False)):
+            with override_settings(GENIUS_PLAZA_INSTRUMENTATION=dict(getattr(settings, 'GENIUS_PLAZA_INSTRUMENTATION', {}), ENABLED=enabled)):
+                start = time.perf_counter()
+                for i in range(per_round):
+                    client.get(urls[i % len(urls)], HTTP_ACCEPT='application/json')
+                timings[enabled].append((time.perf_counter() - start) / per_round)
+    baseline = statistics.median(timings[False])
+    instrumented = statistics.median(timings[True])
+    instrumentation.metrics.reset()
+    return {
+        'requests': per_round * rounds * 2,
+        'baseline_ms_per_request': round(baseline * 1000, 4),
+        'instrumented_ms_per_request': round(instrumented * 1000, 4),
+        'overhead_percent': round((instrumented / baseline - 1) * 100, 2),
+    }
+
+
+@scenario('api')
+def api(count=1000, users=20, steps=200, ingredients=200, requests=200, concurrency=8, endpoint=None, **options):
+    # Every endpoint through the WSGI application of project/wsgi.py from concurrency client threads: latency percentiles, throughput, status codes
+    # and queries per request, as JSON to compare across commits. Runs against whatever database is configured (SQLite, PostgreSQL) via its test database.
+    from project.wsgi import application
+    seed_recipes(count, users=users or 20, steps=steps or 200, ingredients=ingredients or 200)
+    index_recipes()
+    endpoints = [item for item in get_api_endpoints() if not endpoint or item[0] in endpoint]
+    results = {}
+    for name, method, build in endpoints:
+        def run(i):
+            path, body = build(i)
+            start = time.perf_counter()
+            status, queries, size = wsgi_request(application, method, path, body)
+            return time.perf_counter() - start, status, queries, size
+
+        start = time.perf_counter()
+        with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(run, range(requests)))
+        seconds = time.perf_counter() - start
+        connections.close_all()
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        queries = [sample[2] for sample in samples if sample[2] is not None]
+        statuses = {}
+        for sample in samples:
+            statuses[str(sample[1])] = statuses.get(str(sample[1]), 0) + 1
+        results[name] = {
+            'method': method,
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[1] >= 400),
+            'statuses': statuses,
+            'requests_per_second': rate(len(samples), seconds),
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 3),
+                'p95': round(percentile(latencies, 95), 3),
+                'p99': round(percentile(latencies, 99), 3),
+                'mean': round(statistics.mean(latencies), 3),
+            },
+            'queries': {
+                'mean': round(statistics.mean(queries), 2) if queries else None,
+                'max': max(queries) if queries else None,
+            },
+            'bytes_mean': round(statistics.mean(sample[3] for sample in samples)),
+        }
+    return {
+        'commit': git_revision(),
+        'database': connection.vendor,
+        'volumes': {'users': users, 'recipes': count, 'steps': steps, 'ingredients': ingredients},
+        'concurrency': concurrency,
+        'endpoints': results,
+    }
+
+
+@scenario('json')
+def json_rendering(count=1000, **options):
+    # A count-recipe list shaped like /recipe/ (RecipeReadSerializer): serializer time, rendering and parsing with every installed JSON backend
+    # (checked byte for byte against DRF's JSONRenderer), then bytes on the wire with each compression, directly and through the API.
+    seed_recipes(count)
+    repeat = 20
+    start = time.perf_counter()
+    data = serializers.RecipeReadSerializer(models.Recipe.objects.get_recipes()[:count], many=True).data
+    results = {'recipes': len(data), 'serializer_ms': round((time.perf_counter() - start) * 1000, 3), 'render': {}, 'parse': {}, 'compression': {}, 'http': {}}
+    reference = JSONRenderer().render(data)
+    for backend in renderers.BACKENDS:
+        if backend != 'json' and getattr(renderers, backend) is None:
+            results['render'][backend] = results['parse'][backend] = 'not installed'
+            continue
+        with override_settings(GENIUS_PLAZA_JSON_BACKEND=backend):
+            renderer = renderers.FastJSONRenderer()
+            start = time.perf_counter()
+            for i in range(repeat):
+                body = renderer.render(data, 'application/json', {})
+            results['render'][backend] = {'ms': round((time.perf_counter() - start) * 1000 / repeat, 3), 'bytes': len(body), 'identical': body == reference}
+            parser = renderers.FastJSONParser()
+            start = time.perf_counter()
+            for i in range(repeat):
+                parsed = parser.parse(io.BytesIO(body), 'application/json', {'encoding': 'utf-8'})
+            results['parse'][backend] = {'ms': round((time.perf_counter() - start) * 1000 / repeat, 3), 'equal': parsed == json.loads(reference.decode('utf-8'))}
+    compressors = [('gzip', lambda body: gzip.compress(body, compresslevel=6, mtime=0))]
+    if middleware.brotli is not None:
+        compressors.append(('br', lambda body: middleware.brotli.compress(body, quality=5)))
+    for encoding, compress in compressors:
+        start = time.perf_counter()
+        for i in range(repeat):
+            compressed = compress(reference)
+        results['compression'][encoding] = {'ms': round((time.perf_counter() - start) * 1000 / repeat, 3), 'bytes': len(compressed)}
+    client = Client()
+    url = reverse('genius-plaza:recipe-list') + '?pagination=cursor&page_size=%s' % min(count, pagination.CursorPagination.max_page_size)
+    client.get(url, HTTP_ACCEPT='application/json')
+    for encoding in ('identity', 'gzip', 'br'):
+        start = time.perf_counter()
+        for i in range(repeat):
+            response = client.get(url, HTTP_ACCEPT='application/json', HTTP_ACCEPT_ENCODING=encoding)
+        results['http'][encoding] = {
+            'ms': round((time.perf_counter() - start) * 1000 / repeat, 3),
+            'bytes': len(response.content),
+            'content_encoding': response.get('Content-Encoding', 'identity'),
+        }
+    return results
+
+
+@scenario('read_path')
+def read_path(count=10000, **options):
+    # A count-row list of recipes (RecipeReadSerializer) and of users (UserSerializer) read with the serializers and with rows.RowReader, the path the
+    # list views take with fast_read: best of a few runs each, queries included, and the rendered bytes compared.
+    seed_recipes(count, users=count)
+    repeat = 3
+    results = {}
+    for name, queryset, serializer_class in (
+        ('recipes', models.Recipe.objects.get_recipes(), serializers.RecipeReadSerializer),
+        ('users', models.User.objects.all(), serializers.UserSerializer),
+    ):
+        timings = {'serializer': [], 'rows': []}
+        for i in range(repeat):
+            with CaptureQueriesContext(connection) as serializer_queries:
+                start = time.perf_counter()
+                expected = serializer_class(queryset[:count], many=True).data
+                timings['serializer'].append(time.perf_counter() - start)
+            reader = rows.RowReader(serializer_class())
+            with CaptureQueriesContext(connection) as rows_queries:
+                start = time.perf_counter()
+                values = reader.get_queryset(queryset)[:count]
+                data = reader.read(values, values.db)
+                timings['rows'].append(time.perf_counter() - start)
+        results[name] = {
+            'rows': len(data),
+            'serializer_rows_per_second': rate(len(expected), min(timings['serializer'])),
+            'rows_rows_per_second': rate(len(data), min(timings['rows'])),
+            'speedup': round(min(timings['serializer']) / min(timings['rows']), 2),
+            'serializer_queries': len(serializer_queries),
+            'rows_queries': len(rows_queries),
+            'identical': JSONRenderer().render(data) == JSONRenderer().render(expected),
+        }
+    return results
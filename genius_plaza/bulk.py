@@ -0,0 +1,140 @@
+import contextlib
+from django.db import connections, router, transaction
+from django.db.models import AutoField, Case, Max, Value, When
+from django.dispatch import Signal
+
+BATCH_SIZE = 500
+
+# Sent by bulk_create(), bulk_update(), bulk_add_m2m() and bulk_clear_m2m(), which bypass post_save and m2m_changed: sender is the model whose rows
+# were written (the model owning the field, for relations), pks their pks and created whether they are new rows.
+rows_written = Signal(providing_args=['pks', 'created'])
+
+
+@contextlib.contextmanager
+def atomic_write(using=None):
+    # transaction.atomic() for a transaction that reads before it writes: on SQLite the outermost block takes the write lock when it begins (see
+    # genius_plaza.backends.sqlite3). Elsewhere, and nested in another transaction, a plain atomic().
+    connection = transaction.get_connection(using)
+    previous = getattr(connection, 'immediate_transaction', False)
+    connection.immediate_transaction = True
+    try:
+        with transaction.atomic(using=using):
+            # Only its BEGIN reads the flag: the commit hooks run as the block exits and their transactions are not part of it.
+            connection.immediate_transaction = previous
+            yield
+    finally:
+        connection.immediate_transaction = previous
+
+
+def chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def in_bulk(queryset, pks, batch_size=BATCH_SIZE):
+    result = {}
+    for batch in chunks(set(pks), batch_size):
+        result.update(queryset.in_bulk(batch))
+    return result
+
+
+def bulk_create(model, objs, batch_size=BATCH_SIZE):
+    objs = list(objs)
+    if len(objs) == 0:
+        return objs
+    using = router.db_for_write(model)
+    connection = connections[using]
+    manager = model._default_manager.using(using)
+    if connection.features.can_return_ids_from_bulk_insert:
+        # PostgreSQL: INSERT ... RETURNING id, Django sets every pk.
+        manager.bulk_create(objs, batch_size=batch_size)
+    elif connection.vendor == 'sqlite':
+        # SQLite has a single writer: from the first INSERT until commit no other connection can add rows, so the new rows are the last
+        # len(objs) ids of the table (AUTOINCREMENT never reuses one).
+        with transaction.atomic(using=using):
+            manager.bulk_create(objs, batch_size=batch_size)
+            last = manager.aggregate(last=Max('pk'))['last']
+        for pk, obj in zip(range(last - len(objs) + 1, last + 1), objs):
+            obj.pk = pk
+    else:
+        # Neither: one INSERT per row, each returning its own id.
+        fields = [field for field in model._meta.concrete_fields if not isinstance(field, AutoField)]
+        with transaction.atomic(using=using):
+            for obj in objs:
+                obj.pk = manager._insert([obj], fields=fields, return_id=True)
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = using
+    rows_written.send(sender=model, pks=[obj.pk for obj in objs], created=True)
+    return objs
+
+
+def bulk_update(model, objs, fields, batch_size=BATCH_SIZE):
+    # Django 1.11 has no QuerySet.bulk_update(): one UPDATE ... SET field = CASE WHEN id = ... per batch.
+    objs = list(objs)
+    if len(objs) == 0 or len(fields) == 0:
+        return 0
+    model_fields = [model._meta.get_field(name) for name in fields]
+    # Fields derived from the updated ones in pre_save() (e.g. normalized text) are written along with them.
+    model_fields += [field for field in model._meta.concrete_fields if getattr(field, 'source', None) in fields and field not in model_fields]
+    # So are auto_now timestamps, as Model.save() would.
+    model_fields += [field for field in model._meta.concrete_fields if getattr(field, 'auto_now', False) and field not in model_fields]
+    updated = 0
+    for batch in chunks(objs, batch_size):
+        values = {}
+        for field in model_fields:
+            values[field.attname] = Case(
+                *[When(pk=obj.pk, then=Value(field.pre_save(obj, False))) for obj in batch],
+                output_field=field
+            )
+        updated += model._default_manager.filter(pk__in=[obj.pk for obj in batch]).update(**values)
+    rows_written.send(sender=model, pks=[obj.pk for obj in objs], created=False)
+    return updated
+
+
+def insert_rows(model, field_names, rows, batch_size=BATCH_SIZE):
+    # Plain executemany() INSERT of value tuples: no model instances, no pks returned.
+    connection = connections[router.db_for_write(model)]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in field_names),
+        ', '.join(['%s'] * len(field_names)),
+    )
+    with connection.cursor() as cursor:
+        for batch in chunks(rows, batch_size):
+            cursor.executemany(sql, batch)
+
+
+def bulk_add_m2m(model, field_name, pairs, batch_size=BATCH_SIZE):
+    # pairs: (source pk, target pk), written straight into the auto-created through table; building a through instance per row dominates on large imports.
+    field = model._meta.get_field(field_name)
+    pairs = list(pairs)
+    insert_rows(field.remote_field.through, [field.m2m_field_name(), field.m2m_reverse_field_name()], pairs, batch_size=batch_size)
+    if len(pairs) > 0:
+        rows_written.send(sender=model, pks=sorted(set(source_pk for source_pk, target_pk in pairs)), created=False)
+
+
+def m2m_pks(model, field_name, pks, batch_size=BATCH_SIZE):
+    # {source pk: [target pks in target id order]}, read straight from the through table.
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = '%s_id' % field.m2m_field_name()
+    target = '%s_id' % field.m2m_reverse_field_name()
+    result = {}
+    for batch in chunks(pks, batch_size):
+        rows = through._default_manager.filter(**{source + '__in': batch}).order_by(source, target).values_list(source, target)
+        for source_pk, target_pk in rows:
+            result.setdefault(source_pk, []).append(target_pk)
+    return result
+
+
+def bulk_clear_m2m(model, field_name, pks, batch_size=BATCH_SIZE):
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = '%s_id__in' % field.m2m_field_name()
+    pks = list(pks)
+    for batch in chunks(pks, batch_size):
+        through._default_manager.filter(**{source: batch}).delete()
+    if len(pks) > 0:
+        rows_written.send(sender=model, pks=pks, created=False)
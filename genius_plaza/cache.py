@@ -0,0 +1,201 @@
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import router, transaction
+from django.utils.encoding import force_bytes
+from . import bulk, models, routers
+
+HEADER = 'X-Cache'
+
+_caches = {}
+_locks = {}
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+class LRUCache(BaseCache):
+    # Local-memory backend bounded by MAX_ENTRIES that evicts the least recently used entry (LocMemCache culls every CULL_FREQUENCY-th key instead).
+    def __init__(self, name, params):
+        super(LRUCache, self).__init__(params)
+        self._cache = _caches.setdefault(name, OrderedDict())
+        self._lock = _locks.setdefault(name, threading.Lock())
+
+    def _get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _set(self, key, value, timeout):
+        self._cache[key] = (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.get_backend_timeout(timeout))
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            entry = self._get(key)
+        if entry is None:
+            return default
+        return pickle.loads(entry[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            entry = self._get(key)
+            if entry is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(entry[0]) + delta
+            self._cache[key] = (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), entry[1])
+        return value
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            return self._get(key) is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def get_cache():
+    return caches[getattr(settings, 'GENIUS_PLAZA_CACHE', 'default')]
+
+
+def record(kind, hit):
+    with _stats_lock:
+        _stats[(kind, 'hits' if hit else 'misses')] += 1
+
+
+def get_stats():
+    # Counters of this process since start (or the last reset_stats()).
+    with _stats_lock:
+        stats = dict(_stats)
+    result = OrderedDict()
+    for kind in sorted(set(kind for kind, name in stats)):
+        hits = stats.get((kind, 'hits'), 0)
+        misses = stats.get((kind, 'misses'), 0)
+        result[kind] = OrderedDict([
+            ('hits', hits),
+            ('misses', misses),
+            ('hit_ratio', round(hits / float(hits + misses), 4) if hits + misses else None),
+        ])
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def recipe_key(pk):
+    return 'genius_plaza:recipe:%s' % pk
+
+
+def generation_key(name):
+    return 'genius_plaza:generation:%s' % name
+
+
+def get_generations(names):
+    # A list page is cached under the current value of every generation it depends on; a new value orphans the old pages, which then age out of the backend.
+    cache = get_cache()
+    keys = [generation_key(name) for name in names]
+    generations = cache.get_many(keys)
+    missing = dict((key, uuid.uuid4().hex) for key in keys if key not in generations)
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def bump_generations(names):
+    if names:
+        get_cache().set_many(dict((generation_key(name), uuid.uuid4().hex) for name in names), None)
+
+
+def list_key(request, names):
+    # The absolute URI is part of the key: pages embed absolute next/previous links.
+    uri = request.build_absolute_uri()
+    digest = hashlib.md5(force_bytes('%s|%s' % (uri, '|'.join(get_generations(names))))).hexdigest()
+    return 'genius_plaza:list:%s' % digest
+
+
+def user_generation(user_pk):
+    return 'user:%s' % user_pk
+
+
+def get_or_build(key, kind, build):
+    # (data, hit): the serialized payload from the cache, or build() stored for the next request. build() reads from the primary: a lagging
+    # replica would store a payload older than the generations of its key, served until the next change.
+    cache = get_cache()
+    data = cache.get(key)
+    if data is not None:
+        record(kind, True)
+        return data, True
+    with routers.use_replicas(False):
+        data = build()
+    cache.set(key, data)
+    record(kind, False)
+    return data, False
+
+
+def invalidate_recipes(recipe_ids, fields):
+    # Drops the cached recipes and orphans the list pages that may contain them: all recipe lists, plus the per-user lists of their users
+    # (of every user when the owner itself may have changed, since the previous owner is no longer known).
+    recipe_ids = list(recipe_ids)
+    keys = [recipe_key(pk) for pk in recipe_ids]
+    names = ['recipes']
+    if 'user' in fields:
+        names.append('users')
+    else:
+        user_pks = set()
+        for batch in bulk.chunks(recipe_ids):
+            user_pks.update(models.Recipe.objects.filter(pk__in=batch).order_by().values_list('user_id', flat=True).distinct())
+        names.extend(user_generation(pk) for pk in user_pks)
+
+    def invalidate():
+        cache = get_cache()
+        cache.delete_many(keys)
+        bump_generations(names)
+
+    invalidate()
+    using = router.db_for_write(models.Recipe)
+    if transaction.get_connection(using).in_atomic_block:
+        # Again after commit: a concurrent request may have cached the old rows in between.
+        transaction.on_commit(invalidate, using=using)
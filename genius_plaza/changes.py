@@ -0,0 +1,72 @@
+import datetime
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Count, Max
+from django.utils import timezone
+from . import bulk, models
+
+DEFAULTS = {
+    # Changes returned when ?limit= is not given, and the most a request may ask for.
+    'LIMIT': 100,
+    'MAX_LIMIT': 1000,
+    # Changes younger than this are held back from the feed. Ids are handed out when a change is recorded but become visible when its transaction
+    # commits: with concurrent writers (PostgreSQL) a reader could pass over an id that commits later. SQLite serializes writers, so 0 is safe there.
+    'SETTLE_SECONDS': 0,
+}
+
+MODEL_NAMES = {
+    models.User: 'user',
+    models.Recipe: 'recipe',
+    models.Step: 'step',
+    models.Ingredient: 'ingredient',
+}
+
+CREATE = models.Change.ACTION_CREATE
+UPDATE = models.Change.ACTION_UPDATE
+DELETE = models.Change.ACTION_DELETE
+
+
+def get_setting(name):
+    return getattr(settings, 'GENIUS_PLAZA_CHANGES', {}).get(name, DEFAULTS[name])
+
+
+def record(model, pks, action):
+    # A plain executemany() INSERT with no transaction of its own: it joins the caller's (bulk writes, atomic blocks), and costs one statement otherwise.
+    model_name = MODEL_NAMES.get(model)
+    pks = list(pks)
+    if model_name is None or len(pks) == 0:
+        return
+    created = connections[router.db_for_write(models.Change)].ops.adapt_datetimefield_value(timezone.now())
+    bulk.insert_rows(models.Change, ['model_name', 'object_id', 'action', 'created'], [(model_name, pk, action, created) for pk in pks])
+
+
+def get_changes(since, limit):
+    # ([changes], has_more): the ones after the since cursor, oldest first; a primary key range, so a page costs the same at any depth of the log.
+    queryset = models.Change.objects.filter(pk__gt=since).order_by('pk')
+    settle = get_setting('SETTLE_SECONDS')
+    if settle:
+        queryset = queryset.filter(created__lte=timezone.now() - datetime.timedelta(seconds=settle))
+    changes = list(queryset[:limit + 1])
+    return changes[:limit], len(changes) > limit
+
+
+def get_latest():
+    # Cursor of the last change: a mirror takes it before a full download, then follows the feed from there.
+    return models.Change.objects.aggregate(latest=Max('pk'))['latest'] or 0
+
+
+def compact(batch_size=bulk.BATCH_SIZE):
+    # Keeps only the last change of each row. A reader at any cursor still gets it (it is newer than the ones removed), and it says all a mirror
+    # needs: the row is gone (delete) or must be fetched again (create/update). Rows logged while this runs are left for the next compaction.
+    bound = get_latest()
+    changes = models.Change.objects.filter(pk__lte=bound)
+    duplicated = changes.order_by().values('model_name', 'object_id').annotate(last=Max('pk'), count=Count('pk')).filter(count__gt=1)
+    removed = 0
+    for batch in bulk.chunks(duplicated.values_list('model_name', 'object_id', 'last').iterator(), batch_size):
+        by_model = {}
+        for model_name, object_id, last in batch:
+            by_model.setdefault(model_name, {})[object_id] = last
+        with bulk.atomic_write():
+            for model_name, lasts in by_model.items():
+                removed += changes.filter(model_name=model_name, object_id__in=list(lasts)).exclude(pk__in=list(lasts.values())).delete()[0]
+    return removed
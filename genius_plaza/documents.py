@@ -0,0 +1,115 @@
+import json
+import logging
+from django.conf import settings
+from django.db import router
+from django.db.models import Case, TextField, Value, When
+from rest_framework.utils import encoders
+from . import bulk, instrumentation, models, renderers, rows, serializers
+
+DEFAULTS = {
+    # Serve recipe details from Recipe.document. Disabled, the documents of changed recipes are cleared rather than rebuilt, so none is stale
+    # when it is enabled again (run rebuild_recipe_documents then).
+    'ENABLED': True,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def get_setting(name):
+    return getattr(settings, 'GENIUS_PLAZA_RECIPE_DOCUMENTS', {}).get(name, DEFAULTS[name])
+
+
+def dumps(data):
+    return json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(document):
+    if renderers.orjson is not None:
+        return renderers.orjson.loads(document)
+    return json.loads(document)
+
+
+def get_reader():
+    # The document is what RecipeReadSerializer shows of the recipe, read the way the list views read it.
+    return rows.RowReader(serializers.RecipeReadSerializer())
+
+
+def build(recipe_ids, using):
+    # {pk: document} of the recipes that exist.
+    reader = get_reader()
+    queryset = reader.get_queryset(models.Recipe.objects.using(using).filter(pk__in=recipe_ids))
+    return dict((data['id'], dumps(data)) for data in reader.read(queryset, using))
+
+
+def write(documents, using):
+    if len(documents) == 0:
+        return
+    # A plain UPDATE: Recipe.modified stays (touch_recipes already set it for a real change) and no change is logged for a rebuild.
+    models.Recipe.objects.using(using).filter(pk__in=list(documents)).update(document=Case(
+        *[When(pk=pk, then=Value(document)) for pk, document in documents.items()],
+        output_field=TextField()
+    ))
+
+
+def rebuild(recipe_ids, batch_size=bulk.BATCH_SIZE):
+    # Reads and writes on the primary, a transaction per batch. The rows are locked first (PostgreSQL), so a concurrent rebuild of the same
+    # recipes writes after this one and from what it read after it: the last document written is never older than the last change.
+    using = router.db_for_write(models.Recipe)
+    rebuilt = 0
+    for batch in bulk.chunks(set(recipe_ids), batch_size):
+        with bulk.atomic_write(using=using):
+            list(models.Recipe.objects.using(using).select_for_update().filter(pk__in=batch).values_list('pk', flat=True))
+            documents = build(batch, using)
+            write(documents, using)
+        rebuilt += len(documents)
+    return rebuilt
+
+
+def clear(recipe_ids, batch_size=bulk.BATCH_SIZE):
+    using = router.db_for_write(models.Recipe)
+    for batch in bulk.chunks(set(recipe_ids), batch_size):
+        models.Recipe.objects.using(using).filter(pk__in=batch).update(document=None)
+
+
+def recipes_changed(recipe_ids):
+    if not get_setting('ENABLED'):
+        clear(recipe_ids)
+        return
+    try:
+        rebuild(recipe_ids)
+    except Exception:
+        # The change itself may be committed already (autocommit, or an earlier batch): the recipes lose their documents and are served by the
+        # serializer until the next rebuild, rather than from a document older than the change.
+        logger.exception('Rebuilding the documents of %s recipes failed', len(recipe_ids))
+        clear(recipe_ids)
+
+
+def iter_batches(batch_size=bulk.BATCH_SIZE):
+    # Keyset walk over every recipe pk on the primary, batch_size at a time.
+    queryset = models.Recipe.objects.using(router.db_for_write(models.Recipe)).order_by('pk')
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+        if len(pks) == 0:
+            return
+        last_pk = pks[-1]
+        yield pks
+
+
+def check(recipe_ids):
+    # ([missing pks], [stale pks]): recipes without a document, and with one that differs from what a rebuild would write now.
+    using = router.db_for_write(models.Recipe)
+    stored = dict(models.Recipe.objects.using(using).filter(pk__in=recipe_ids).values_list('pk', 'document'))
+    expected = build(recipe_ids, using)
+    missing = sorted(pk for pk, document in stored.items() if document is None and pk in expected)
+    stale = sorted(pk for pk, document in stored.items() if document is not None and document != expected.get(pk))
+    return missing, stale
+
+
+def get_document(pk):
+    # The recipe's representation as stored, or None when it does not exist or has no document yet.
+    document = models.Recipe.objects.filter(pk=pk).values_list('document', flat=True).first()
+    if document is None:
+        return None
+    with instrumentation.timer('serializer'):
+        return loads(document)
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+from collections import OrderedDict
+from . import bulk, models
+
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CSV_HEADER = ('id', 'name', 'user_id', 'username', 'steps', 'ingredients')
+
+
+def iter_recipe_chunks(queryset=None, chunk_size=bulk.BATCH_SIZE):
+    # Lists of recipes as plain dicts shaped like RecipeReadSerializer, chunk_size at a time and three queries per chunk.
+    # Keyset pages on the primary key rather than one QuerySet.iterator(): SQLite cannot stream a cursor (the whole result would be buffered)
+    # and only one chunk is held in memory at a time whatever the backend.
+    if queryset is None:
+        queryset = models.Recipe.objects.all()
+    queryset = queryset.order_by('pk')
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).values_list(
+            'pk', 'name', 'user_id', 'user__first_name', 'user__last_name', 'user__username'
+        )[:chunk_size])
+        if len(rows) == 0:
+            return
+        last_pk = rows[-1][0]
+        pks = [row[0] for row in rows]
+        steps = related_items(models.Recipe.steps.through, 'step', 'step_text', pks)
+        ingredients = related_items(models.Recipe.ingredients.through, 'ingredient', 'text', pks)
+        chunk = []
+        for pk, name, user_id, first_name, last_name, username in rows:
+            user = None
+            if user_id is not None:
+                user = OrderedDict([('id', user_id), ('first_name', first_name), ('last_name', last_name), ('username', username)])
+            chunk.append(OrderedDict([
+                ('id', pk),
+                ('name', name),
+                ('user', user),
+                ('steps', steps.get(pk, [])),
+                ('ingredients', ingredients.get(pk, [])),
+            ]))
+        yield chunk
+
+
+def related_items(through, name, text_field, pks):
+    # {recipe pk: [{'id': ..., text_field: ...}, ...]} in related id order, from one query over the through table joined to the related table.
+    result = {}
+    rows = through.objects.filter(recipe_id__in=pks).order_by('recipe_id', '%s_id' % name).values_list(
+        'recipe_id', '%s_id' % name, '%s__%s' % (name, text_field)
+    )
+    for recipe_id, pk, text in rows:
+        result.setdefault(recipe_id, []).append(OrderedDict([('id', pk), (text_field, text)]))
+    return result
+
+
+def ndjson_chunks(chunks):
+    # One JSON document per line, encoded like the API's JSON renderer (compact, UTF-8).
+    for chunk in chunks:
+        yield ''.join(json.dumps(recipe, ensure_ascii=False, separators=(',', ':')) + '\n' for recipe in chunk).encode('utf-8')
+
+
+def csv_chunks(chunks):
+    # steps / ingredients cells hold JSON arrays of texts, so any text survives the round trip (see import_recipes).
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    for chunk in chunks:
+        for recipe in chunk:
+            writer.writerow((
+                recipe['id'],
+                recipe['name'],
+                recipe['user']['id'] if recipe['user'] else '',
+                recipe['user']['username'] if recipe['user'] else '',
+                json.dumps([step['step_text'] for step in recipe['steps']], ensure_ascii=False),
+                json.dumps([ingredient['text'] for ingredient in recipe['ingredients']], ensure_ascii=False),
+            ))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def encode(format, chunks):
+    if format == 'csv':
+        return csv_chunks(chunks)
+    return ndjson_chunks(chunks)
+
+
+def export_recipes(format, queryset=None, chunk_size=bulk.BATCH_SIZE):
+    # Iterator of encoded byte strings, one per chunk of recipes.
+    return encode(format, iter_recipe_chunks(queryset, chunk_size))
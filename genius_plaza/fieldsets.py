@@ -0,0 +1,84 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import exceptions, relations, serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse_names(request, param, allowed):
+    # ?fields=id,name -> ['id', 'name']; None when the parameter is not given, ValidationError for a name that is not in allowed.
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    names = []
+    for name in value.split(','):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise exceptions.ValidationError({param: ['Unknown field "%s"; use any of: %s.' % (name, ', '.join(allowed)) for name in unknown]})
+    return names
+
+
+def get_load_plan(model, serializer, prefix=''):
+    # (only() names or None for every column, select_related() names, [Prefetch]) loading what serializer shows of model and nothing else:
+    # a forward relation shown nested is joined, one shown as a pk is just its column; many-to-many ones are prefetched with the columns they show.
+    only = [prefix + model._meta.pk.name]
+    select_related = []
+    prefetch = []
+    for field in serializer._readable_fields:
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            # Computed from the instance (source='*', a property, a method): no telling which columns it reads.
+            only = None
+            continue
+        if model_field.many_to_many:
+            child = getattr(field, 'child', None)
+            related_model = model_field.related_model
+            if isinstance(child, serializers.ModelSerializer):
+                related_only, related_select, related_prefetch = get_load_plan(related_model, child)
+                queryset = related_model._default_manager.select_related(*related_select).prefetch_related(*related_prefetch)
+                if related_only is not None:
+                    queryset = queryset.only(*related_only)
+            else:
+                queryset = related_model._default_manager.only(related_model._meta.pk.name)
+            prefetch.append(Prefetch(prefix + model_field.name, queryset=queryset))
+        elif model_field.is_relation and model_field.concrete:
+            if only is not None:
+                only.append(prefix + model_field.name)
+            if isinstance(field, serializers.ModelSerializer):
+                select_related.append(prefix + model_field.name)
+                related_only, related_select, related_prefetch = get_load_plan(model_field.related_model, field, prefix + model_field.name + '__')
+                if related_only is None:
+                    only = None
+                elif only is not None:
+                    only.extend(related_only)
+                select_related.extend(related_select)
+                prefetch.extend(related_prefetch)
+            elif not isinstance(field, relations.RelatedField):
+                # A nested non-model representation of the relation: load the related row whole.
+                select_related.append(prefix + model_field.name)
+                only = None
+        elif model_field.concrete:
+            if only is not None:
+                only.append(prefix + model_field.name)
+        else:
+            # Reverse relations are left to the serializer (and to the queryset's own prefetches).
+            only = None
+    return only, select_related, prefetch
+
+
+def shape_queryset(queryset, serializer):
+    # The view's queryset reduced to what the (sparse) serializer shows: its own joins and prefetches are replaced by the ones the fields need.
+    only, select_related, prefetch = get_load_plan(queryset.model, serializer)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if only is not None:
+        queryset = queryset.only(*only)
+    return queryset
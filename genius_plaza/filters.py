@@ -0,0 +1,30 @@
+from rest_framework import exceptions
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.filters import BaseFilterBackend
+from . import fulltext
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    # ?search=tomato basil -onion, ?search=soup OR stew, ?search=tom* over recipe names, step texts and ingredient texts, best match first.
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if query.strip() == '':
+            return queryset
+        try:
+            return fulltext.search_recipes(queryset, query)
+        except ValueError as exc:
+            raise exceptions.ValidationError({self.search_param: [str(exc)]})
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [
+            coreapi.Field(
+                name=self.search_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(title='Search', description='Full-text search over recipe names, steps and ingredients.')
+            )
+        ]
@@ -1,6 +1,6 @@
 from django import forms
 from django.core import validators
-from . import models
+from . import models, passwords
 
 FIELD_FIRST_NAME = forms.CharField(
     label='First name',
@@ -80,10 +80,15 @@ FIELD_PASSWORD_CONFIRMATION = forms.CharField(
 
 class FieldPasswordHashReadOnlyWidget(forms.Widget):
     def render(self, name, value, attrs=None, renderer=None):
-        print('************', name)
+        scheme = passwords.identify(str(value)) if value else None
         result = str(value).split('$')
-        if len(result) != 4:
+        if scheme is None:
             return 'Invalid password format or unknown hashing algorithm.'
+        elif scheme != 'django_pbkdf2_sha256':
+            return '''
+            <b>algorithm:</b> %s
+            <b>hash:</b> %s**************************************
+            ''' % (result[0], result[-1][0:6])
         else:
             return '''
             <b>algorithm:</b> %s 
@@ -201,3 +206,14 @@ class UserPasswordChange(forms.Form):
         if commit:
             self.user.save()
         return self.user
+
+
+class NormalizedTextForm(forms.ModelForm):
+    # Steps and ingredients are unique by normalized text, a column the form does not show: checked here so a duplicate is a form error.
+    def clean(self):
+        super_clean = super(NormalizedTextForm, self).clean()
+        source = self._meta.model.objects.get_normalized_field().source
+        text = self.cleaned_data.get(source)
+        if text is not None and self._meta.model.objects.filter_text(text).exclude(pk=self.instance.pk).exists():
+            self.add_error(source, 'A %s with this text (compared case and whitespace folded) already exists.' % self._meta.model._meta.verbose_name.lower())
+        return super_clean
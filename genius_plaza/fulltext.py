@@ -0,0 +1,173 @@
+from django.db import connections, router
+from django.db.models import Q
+from . import bulk, models, search
+
+
+class SQLiteBackend(object):
+    # FTS5 virtual table keyed by rowid = recipe id, ranked with bm25() (lower is better).
+    table = 'genius_plaza_recipe_fts'
+    weights = (10.0, 1.0, 5.0)
+    ordering = 'search_rank'
+
+    def __init__(self):
+        self.available = {}
+
+    def is_available(self, connection):
+        if connection.alias not in self.available:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA compile_options')
+                self.available[connection.alias] = 'ENABLE_FTS5' in [row[0] for row in cursor.fetchall()]
+        return self.available[connection.alias]
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(name, steps, ingredients, tokenize = "unicode61 remove_diacritics 2")' % self.table
+            )
+
+    def delete(self, connection, recipe_ids):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (self.table, ', '.join(['%s'] * len(recipe_ids))), recipe_ids)
+
+    def insert(self, connection, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany('INSERT INTO %s (rowid, name, steps, ingredients) VALUES (%%s, %%s, %%s, %%s)' % self.table, rows)
+
+    def get_match(self, groups):
+        clauses = []
+        for group in groups:
+            terms = ['"%s"%s' % (term, '*' if prefix else '') for negated, term, prefix in group if not negated]
+            if len(terms) == 0:
+                raise ValueError('Each alternative needs at least one term that is not negated.')
+            clause = ' AND '.join(terms)
+            for negated, term, prefix in group:
+                if negated:
+                    clause += ' NOT "%s"%s' % (term, '*' if prefix else '')
+            clauses.append('(%s)' % clause)
+        return ' OR '.join(clauses)
+
+    def search(self, queryset, groups):
+        recipe_table = queryset.model._meta.db_table
+        return queryset.extra(
+            select={'search_rank': 'bm25(%s, %s)' % (self.table, ', '.join(str(weight) for weight in self.weights))},
+            tables=[self.table],
+            where=['%s.rowid = %s.id' % (self.table, recipe_table), '%s MATCH %%s' % self.table],
+            params=[self.get_match(groups)],
+            order_by=[self.ordering],
+        )
+
+
+class PostgreSQLBackend(object):
+    # tsvector per recipe in a side table with a GIN index, ranked with ts_rank() (higher is better).
+    table = 'genius_plaza_recipe_search'
+    config = 'english'
+    ordering = '-search_rank'
+
+    def is_available(self, connection):
+        return True
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS %s ('
+                'recipe_id integer PRIMARY KEY REFERENCES %s (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+                'document tsvector NOT NULL)' % (self.table, models.Recipe._meta.db_table)
+            )
+            cursor.execute('CREATE INDEX IF NOT EXISTS %s_document ON %s USING GIN (document)' % (self.table, self.table))
+
+    def delete(self, connection, recipe_ids):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE recipe_id IN (%s)' % (self.table, ', '.join(['%s'] * len(recipe_ids))), recipe_ids)
+
+    def insert(self, connection, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO %s (recipe_id, document) VALUES (%%s, '
+                "setweight(to_tsvector('%s', %%s), 'A') || setweight(to_tsvector('%s', %%s), 'C') || setweight(to_tsvector('%s', %%s), 'B'))"
+                % (self.table, self.config, self.config, self.config),
+                rows
+            )
+
+    def get_match(self, groups):
+        clauses = []
+        for group in groups:
+            terms = ['%s%s%s' % ('!' if negated else '', term, ':*' if prefix else '') for negated, term, prefix in group]
+            clauses.append('(%s)' % ' & '.join(terms))
+        return ' | '.join(clauses)
+
+    def search(self, queryset, groups):
+        recipe_table = queryset.model._meta.db_table
+        match = self.get_match(groups)
+        return queryset.extra(
+            select={'search_rank': "ts_rank(%s.document, to_tsquery('%s', %%s))" % (self.table, self.config)},
+            select_params=[match],
+            tables=[self.table],
+            where=['%s.recipe_id = %s.id' % (self.table, recipe_table), "%s.document @@ to_tsquery('%s', %%s)" % (self.table, self.config)],
+            params=[match],
+            order_by=[self.ordering],
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend(),
+    'postgresql': PostgreSQLBackend(),
+}
+
+
+def get_backend(using=None):
+    connection = connections[using or router.db_for_read(models.Recipe)]
+    backend = BACKENDS.get(connection.vendor)
+    if backend is None or not backend.is_available(connection):
+        return None
+    return backend
+
+
+def install(using):
+    backend = get_backend(using)
+    if backend is not None:
+        backend.install(connections[using])
+
+
+def index_recipes(recipe_ids, batch_size=bulk.BATCH_SIZE, replace=True):
+    # Rewrites the documents (name, step texts, ingredient texts) of the given recipes; deleted recipes are only removed. Called once per
+    # committed transaction (signals.send_recipes_changed()), each batch replaced in a transaction of its own: a search never misses a recipe
+    # between the DELETE and the INSERT.
+    using = router.db_for_write(models.Recipe)
+    backend = get_backend(using)
+    if backend is None:
+        return
+    connection = connections[using]
+    for batch in bulk.chunks(set(recipe_ids), batch_size):
+        with bulk.atomic_write(using=using):
+            index_batch(backend, connection, batch, replace)
+
+
+def index_batch(backend, connection, batch, replace):
+    if replace:
+        backend.delete(connection, batch)
+    names = dict(models.Recipe.objects.filter(pk__in=batch).values_list('pk', 'name'))
+    steps = {}
+    for recipe_id, text in models.Recipe.steps.through.objects.filter(recipe_id__in=batch).order_by('step_id').values_list('recipe_id', 'step__step_text'):
+        steps.setdefault(recipe_id, []).append(text)
+    ingredients = {}
+    for recipe_id, text in models.Recipe.ingredients.through.objects.filter(recipe_id__in=batch).order_by('ingredient_id').values_list('recipe_id', 'ingredient__text'):
+        ingredients.setdefault(recipe_id, []).append(text)
+    backend.insert(connection, [
+        (pk, name, '\n'.join(steps.get(pk, [])), '\n'.join(ingredients.get(pk, []))) for pk, name in sorted(names.items())
+    ])
+
+
+def search_recipes(queryset, query):
+    # Annotates search_rank and orders by relevance; falls back to a name LIKE filter on backends without full-text support.
+    groups = search.parse_query(query)
+    backend = get_backend(queryset.db)
+    if backend is not None:
+        return backend.search(queryset, groups)
+    condition = Q()
+    for group in groups:
+        group_condition = Q()
+        for negated, term, prefix in group:
+            term_condition = Q(name__icontains=term)
+            group_condition &= ~term_condition if negated else term_condition
+        condition |= group_condition
+    return queryset.filter(condition)
@@ -0,0 +1,190 @@
+import csv
+import json
+from . import bulk, models, signals
+
+FORMATS = ('json', 'ndjson', 'csv')
+READ_SIZE = 1 << 16
+
+
+def guess_format(path):
+    for format in FORMATS:
+        if path.lower().endswith('.' + format):
+            return format
+    return 'ndjson'
+
+
+def iter_json_array(stream, read_size=READ_SIZE):
+    # Elements of a top-level JSON array, decoded one at a time from a text stream: the file is never held in memory as a whole.
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        data = stream.read(read_size)
+        if not data:
+            eof = True
+        buffer = buffer[pos:] + data
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError('Expected a JSON array.')
+    pos += 1
+    first = True
+    while True:
+        skip_whitespace()
+        if buffer[pos:pos + 1] == ']':
+            return
+        if not first:
+            if buffer[pos:pos + 1] != ',':
+                raise ValueError('Expected "," or "]" in the JSON array.')
+            pos += 1
+            skip_whitespace()
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # A number at the end of the buffer may be cut short: only trust it when something follows.
+            if end == len(buffer) and not eof and not isinstance(element, (dict, list)):
+                fill()
+                continue
+            break
+        pos = end
+        first = False
+        yield element
+
+
+def read_raw_records(stream, format):
+    # (record number, raw record): a line of NDJSON, a CSV row dict or a decoded JSON element; parse_record() makes sense of them.
+    if format == 'json':
+        for number, element in enumerate(iter_json_array(stream), 1):
+            yield number, element
+    elif format == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), 1):
+            yield number, row
+    else:
+        number = 0
+        for line in stream:
+            if line.strip():
+                number += 1
+                yield number, line
+
+
+def parse_texts(value, key):
+    # A list of texts, of {key: text} objects (the export shape) or, in CSV cells, either one encoded as JSON.
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, list):
+        raise ValueError('Expected a list of texts.')
+    texts = []
+    for item in value:
+        if isinstance(item, dict):
+            item = item.get(key)
+        if not isinstance(item, str) or not item.strip():
+            raise ValueError('Expected a non-empty text.')
+        if len(item) > 100:
+            raise ValueError('Ensure texts have no more than 100 characters.')
+        texts.append(item)
+    return texts
+
+
+def parse_record(format, raw):
+    # {'name', 'username', 'email', 'steps', 'ingredients'}; raises ValueError for anything that cannot become a recipe.
+    if format == 'ndjson':
+        raw = json.loads(raw)
+    if not isinstance(raw, dict):
+        raise ValueError('Expected an object.')
+    name = raw.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError('name: This field is required.')
+    if len(name) > 100:
+        raise ValueError('name: Ensure this field has no more than 100 characters.')
+    user = raw.get('user')
+    username = raw.get('username') or None
+    email = raw.get('email') or None
+    if isinstance(user, dict):
+        username = username or user.get('username') or None
+        email = email or user.get('email') or None
+    elif isinstance(user, str) and user:
+        username = username or user
+    try:
+        steps = parse_texts(raw.get('steps'), 'step_text')
+    except ValueError as exc:
+        raise ValueError('steps: %s' % exc)
+    try:
+        ingredients = parse_texts(raw.get('ingredients'), 'text')
+    except ValueError as exc:
+        raise ValueError('ingredients: %s' % exc)
+    return {'name': name, 'username': username, 'email': email, 'steps': steps, 'ingredients': ingredients}
+
+
+def parse_batch(format, raw_records):
+    # [(number, record or None, error or None)]; module level so a process pool can run it.
+    result = []
+    for number, raw in raw_records:
+        try:
+            result.append((number, parse_record(format, raw), None))
+        except ValueError as exc:
+            result.append((number, None, str(exc)))
+    return result
+
+
+def unique(items):
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
+
+
+def write_batch(records):
+    # One transaction per batch: users resolved with two queries, steps / ingredients de-duplicated and resolved with get_or_create_by_texts(),
+    # recipes bulk inserted, through rows written with executemany. Returns ([recipe pks], [(number, error)]).
+    users = models.User.objects.get_users_by_usernames(record['username'] for number, record in records if record['username'])
+    users_by_email = models.User.objects.get_users_by_emails(record['email'] for number, record in records if record['email'] and not record['username'])
+    valid = []
+    errors = []
+    for number, record in records:
+        user = None
+        if record['username']:
+            user = users.get(record['username'])
+            if user is None:
+                errors.append((number, 'user: No user with username "%s".' % record['username']))
+                continue
+        elif record['email']:
+            user = users_by_email.get(record['email'])
+            if user is None:
+                errors.append((number, 'user: No user with email "%s".' % record['email']))
+                continue
+        valid.append((record, user))
+    if len(valid) == 0:
+        return [], errors
+    step_texts = unique(text for record, user in valid for text in record['steps'])
+    ingredient_texts = unique(text for record, user in valid for text in record['ingredients'])
+    with bulk.atomic_write():
+        steps = dict(zip(step_texts, models.Step.objects.get_or_create_by_texts(step_texts)))
+        ingredients = dict(zip(ingredient_texts, models.Ingredient.objects.get_or_create_by_texts(ingredient_texts)))
+        recipes = bulk.bulk_create(models.Recipe, [models.Recipe(name=record['name'], user=user) for record, user in valid])
+        bulk.bulk_add_m2m(models.Recipe, 'steps', [
+            (recipe.pk, pk) for recipe, (record, user) in zip(recipes, valid) for pk in unique(steps[text].pk for text in record['steps'])
+        ])
+        bulk.bulk_add_m2m(models.Recipe, 'ingredients', [
+            (recipe.pk, pk) for recipe, (record, user) in zip(recipes, valid) for pk in unique(ingredients[text].pk for text in record['ingredients'])
+        ])
+        pks = [recipe.pk for recipe in recipes]
+        signals.send_recipes_changed(pks, signals.RECIPE_FIELDS, touched=True)
+    return pks, errors
@@ -0,0 +1,60 @@
+from django.db import IntegrityError, connections, transaction
+from . import models
+
+# Indexes Meta.indexes cannot declare in Django 1.11 (expressions); created with IF NOT EXISTS after every migrate.
+EXPRESSION_INDEXES = (
+    ('gp_user_email_lower_idx', models.User, 'LOWER(email)'),
+    ('gp_user_username_lower_idx', models.User, 'LOWER(username)'),
+)
+
+
+def get_through_indexes():
+    # (name, table, columns, unique) for the auto-created many-to-many tables: the (source, target) pair and the target on its own.
+    result = []
+    for field in models.Recipe._meta.many_to_many:
+        through = field.remote_field.through
+        table = through._meta.db_table
+        source = through._meta.get_field(field.m2m_field_name()).column
+        target = through._meta.get_field(field.m2m_reverse_field_name()).column
+        result.append(('%s_pair_uniq' % table, table, (source, target), True))
+        result.append(('%s_%s_idx' % (table, target), table, (target,), False))
+    return result
+
+
+def get_normalized_text_indexes():
+    # (name, table, column) of the unique index over each normalized text column (see models.NormalizedTextField).
+    result = []
+    for model in (models.Step, models.Ingredient):
+        column = model.objects.get_normalized_field().column
+        result.append(('%s_%s_uniq' % (model._meta.db_table, column), model._meta.db_table, column))
+    return result
+
+
+def install(using):
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for name, model, expression in EXPRESSION_INDEXES:
+            cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (quote(name), quote(model._meta.db_table), expression))
+        for name, table, column in get_normalized_text_indexes():
+            fallback = name.replace('_uniq', '_idx')
+            try:
+                with transaction.atomic(using=using):
+                    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS %s ON %s (%s)' % (quote(name), quote(table), quote(column)))
+            except IntegrityError:
+                # Rows with the same normalized text already stored: indexed without the constraint until merge_duplicates merges them.
+                cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (quote(fallback), quote(table), quote(column)))
+            else:
+                cursor.execute('DROP INDEX IF EXISTS %s' % quote(fallback))
+        if connection.vendor != 'sqlite':
+            return
+        # SQLite only: Django 1.11 drops the deferred index SQL of tables whose name contains the name of a table it rebuilds (genius_plaza_recipe_*),
+        # which leaves the through tables without their unique (recipe, target) constraint and target index.
+        for name, table, columns, unique in get_through_indexes():
+            sql = 'CREATE %sINDEX IF NOT EXISTS %s ON %s (%s)' % ('UNIQUE ' if unique else '', quote(name), quote(table), ', '.join(quote(column) for column in columns))
+            try:
+                with transaction.atomic(using=using):
+                    cursor.execute(sql)
+            except IntegrityError:
+                # Duplicate pairs already stored: index them without the constraint rather than failing the migration.
+                cursor.execute(sql.replace('UNIQUE ', '').replace(quote(name), quote(name.replace('_uniq', '_idx'))))
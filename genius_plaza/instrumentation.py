@@ -0,0 +1,212 @@
+import bisect
+import contextlib
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db.backends import utils
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Upper bounds (seconds) of the request latency histogram buckets.
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    # The same SQL (placeholders, not values) run this many times in one request is reported as an N+1.
+    'N_PLUS_ONE_THRESHOLD': 5,
+}
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+def get_setting(name):
+    return getattr(settings, 'GENIUS_PLAZA_INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.batch_rows = 0
+        self.db_time = 0.0
+        self.shapes = {}
+        self.timings = {}
+        self.active = set()
+
+    def record_query(self, sql, duration, rows=None):
+        # An executemany() is one statement (and one run of its SQL for N+1 detection) whatever its number of rows, kept apart in batch_rows.
+        self.queries += 1
+        self.batch_rows += rows or 0
+        self.db_time += duration
+        self.shapes[sql] = self.shapes.get(sql, 0) + 1
+
+    def get_n_plus_one(self, threshold):
+        # [(count, sql)] of the statements repeated threshold times or more, most repeated first.
+        return sorted(((count, sql) for sql, count in self.shapes.items() if count >= threshold), reverse=True)
+
+
+def start():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def stop():
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    return stats
+
+
+def get_current():
+    return getattr(_local, 'stats', None)
+
+
+@contextlib.contextmanager
+def timer(name):
+    # Adds the time spent in the block to the current request's timing for name; nested blocks of the same name count once.
+    stats = get_current()
+    if stats is None or name in stats.active:
+        yield
+        return
+    stats.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.timings[name] = stats.timings.get(name, 0.0) + time.perf_counter() - started
+        stats.active.discard(name)
+
+
+class InstrumentedCursorMixin(object):
+    # Times every statement for the current request and keeps its SQL before the parameters are interpolated, which is what N+1 detection groups by.
+    def execute(self, sql, params=None):
+        stats = get_current()
+        if stats is None:
+            return super(InstrumentedCursorMixin, self).execute(sql, params)
+        started = time.perf_counter()
+        try:
+            return super(InstrumentedCursorMixin, self).execute(sql, params)
+        finally:
+            stats.record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, param_list):
+        stats = get_current()
+        if stats is None:
+            return super(InstrumentedCursorMixin, self).executemany(sql, param_list)
+        started = time.perf_counter()
+        try:
+            return super(InstrumentedCursorMixin, self).executemany(sql, param_list)
+        finally:
+            try:
+                rows = len(param_list)
+            except TypeError:
+                # An iterator: consumed by the statement, its length is unknown.
+                rows = None
+            stats.record_query(sql, time.perf_counter() - started, rows=rows)
+
+
+class InstrumentedCursorWrapper(InstrumentedCursorMixin, utils.CursorWrapper):
+    pass
+
+
+class InstrumentedCursorDebugWrapper(InstrumentedCursorMixin, utils.CursorDebugWrapper):
+    pass
+
+
+def install(connection):
+    # Connection wrappers are per thread and per alias: each one gets the instrumented cursors the first time a request uses it.
+    if getattr(connection, 'instrumented', False):
+        return
+    connection.make_cursor = lambda cursor: InstrumentedCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: InstrumentedCursorDebugWrapper(cursor, connection)
+    connection.instrumented = True
+
+
+class Series(object):
+    def __init__(self, buckets):
+        self.buckets = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.batch_rows = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.render_seconds = 0.0
+        self.response_bytes = 0
+        self.n_plus_one = 0
+
+
+class Metrics(object):
+    # Per process: with several workers, each one exposes its own counters (scrape them all, or sum by route).
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, labels, seconds, stats, response_bytes, n_plus_one):
+        buckets = get_setting('BUCKETS')
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = Series(buckets)
+            series.buckets[bisect.bisect_left(buckets, seconds)] += 1
+            series.count += 1
+            series.seconds += seconds
+            series.queries += stats.queries
+            series.batch_rows += stats.batch_rows
+            series.db_seconds += stats.db_time
+            series.serializer_seconds += stats.timings.get('serializer', 0.0)
+            series.render_seconds += stats.timings.get('render', 0.0)
+            series.response_bytes += response_bytes
+            series.n_plus_one += n_plus_one
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4.
+        buckets = get_setting('BUCKETS')
+        with self.lock:
+            series = sorted(self.series.items())
+            lines = [
+                '# HELP genius_plaza_request_duration_seconds Request latency by route.',
+                '# TYPE genius_plaza_request_duration_seconds histogram',
+            ]
+            for labels, item in series:
+                cumulative = 0
+                for bound, count in zip(tuple(buckets) + ('+Inf',), item.buckets):
+                    cumulative += count
+                    lines.append('genius_plaza_request_duration_seconds_bucket{%s,le="%s"} %s' % (format_labels(labels), bound, cumulative))
+                lines.append('genius_plaza_request_duration_seconds_sum{%s} %r' % (format_labels(labels), item.seconds))
+                lines.append('genius_plaza_request_duration_seconds_count{%s} %s' % (format_labels(labels), item.count))
+            for name, attribute, help in (
+                ('genius_plaza_db_queries_total', 'queries', 'Database queries run by requests.'),
+                ('genius_plaza_db_batch_rows_total', 'batch_rows', 'Rows sent by executemany() statements, each counted as one query.'),
+                ('genius_plaza_db_seconds_total', 'db_seconds', 'Time spent in database queries.'),
+                ('genius_plaza_serializer_seconds_total', 'serializer_seconds', 'Time spent building serializer representations.'),
+                ('genius_plaza_render_seconds_total', 'render_seconds', 'Time spent rendering responses.'),
+                ('genius_plaza_response_bytes_total', 'response_bytes', 'Bytes of response bodies (streaming responses are not counted).'),
+                ('genius_plaza_n_plus_one_total', 'n_plus_one', 'Requests that repeated one SQL statement N_PLUS_ONE_THRESHOLD times or more.'),
+            ):
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s counter' % name)
+                for labels, item in series:
+                    lines.append('%s{%s} %r' % (name, format_labels(labels), getattr(item, attribute)))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    route, method, status = labels
+    return 'route="%s",method="%s",status="%s"' % (route.replace('\\', '\\\\').replace('"', '\\"'), method, status)
+
+
+metrics = Metrics()
+
+
+def server_timing(stats, total):
+    # Server-Timing header value: durations in milliseconds, as browsers' developer tools show them.
+    entries = ['db;dur=%.2f;desc="%s queries"' % (stats.db_time * 1000, stats.queries)]
+    for name in ('serializer', 'render'):
+        if name in stats.timings:
+            entries.append('%s;dur=%.2f' % (name, stats.timings[name] * 1000))
+    entries.append('total;dur=%.2f' % (total * 1000))
+    return ', '.join(entries)
@@ -0,0 +1,28 @@
+import json
+from django.core.management.base import BaseCommand
+from genius_plaza import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Runs a benchmark scenario against a throw-away test database and prints the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(benchmarks.SCENARIOS))
+        parser.add_argument('--count', type=int, default=1000, help='Number of objects per measurement (seeded recipes for api).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Objects per request on batched paths.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads on concurrent scenarios.')
+        parser.add_argument('--users', type=int, default=20, help='Seeded users (api).')
+        parser.add_argument('--steps', type=int, default=200, help='Seeded steps (api).')
+        parser.add_argument('--ingredients', type=int, default=200, help='Seeded ingredients (api).')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint (api).')
+        parser.add_argument('--endpoint', action='append', default=None, help='Only this endpoint (api); repeatable.')
+        parser.add_argument('--output', default=None, help='Also write the JSON results to this file.')
+
+    def handle(self, *args, **options):
+        with benchmarks.test_database(verbosity=max(options['verbosity'] - 1, 0)):
+            results = benchmarks.SCENARIOS[options['scenario']](**options)
+        data = json.dumps({'scenario': options['scenario'], 'results': results}, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(data)
+        self.stdout.write(data)
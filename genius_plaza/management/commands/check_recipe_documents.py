@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from genius_plaza import bulk, documents
+
+
+class Command(BaseCommand):
+    help = 'Compares the stored document of every recipe with a fresh build and fails when one is missing or stale.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE, help='Recipes per batch.')
+        parser.add_argument('--repair', action='store_true', default=False, help='Rebuild the missing and stale documents.')
+
+    def handle(self, *args, **options):
+        checked = 0
+        missing = []
+        stale = []
+        for pks in documents.iter_batches(options['batch_size']):
+            batch_missing, batch_stale = documents.check(pks)
+            missing.extend(batch_missing)
+            stale.extend(batch_stale)
+            checked += len(pks)
+        self.stdout.write('Checked %s recipes: %s without a document, %s stale.' % (checked, len(missing), len(stale)))
+        if stale:
+            self.stdout.write('Stale: %s' % ', '.join(str(pk) for pk in stale[:100]) + (' ...' if len(stale) > 100 else ''))
+        if options['repair']:
+            self.stdout.write('Rebuilt %s recipe documents.' % documents.rebuild(missing + stale, batch_size=options['batch_size']))
+        elif missing or stale:
+            raise CommandError('Recipe documents are missing or stale; run with --repair or rebuild_recipe_documents.')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from genius_plaza import bulk, changes, models
+
+
+class Command(BaseCommand):
+    help = 'Compacts the change log read by /genius-plaza/changes/: only the last change of each row is kept.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE, help='Rows compacted per transaction.')
+
+    def handle(self, *args, **options):
+        before = models.Change.objects.count()
+        removed = changes.compact(batch_size=options['batch_size'])
+        self.stdout.write('Removed %s of %s changes.' % (removed, before))
@@ -0,0 +1,98 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.db.models.functions import Lower
+from genius_plaza import models
+
+
+def get_hot_queries():
+    # (label, queryset) for the lookups the API and the admin run on every request; each one must be answered from an index.
+    through_steps = models.Recipe.steps.through.objects
+    through_ingredients = models.Recipe.ingredients.through.objects
+    return [
+        ('UserManager.get_users()', models.User.objects.get_users()[:10]),
+        ('UserAdmin changelist', models.User.objects.order_by('first_name', 'last_name', '-pk')[:10]),
+        ('RecipeAdmin changelist', models.Recipe.objects.order_by('name', '-pk')[:10]),
+        ('Recipes by user pk', models.Recipe.objects.filter(user_id=1).order_by('id')[:10]),
+        ('Recipes by username', models.Recipe.objects.filter(user__username='username').order_by('id')[:10]),
+        ('User by email, case-insensitive', models.User.objects.annotate(email_lower=Lower('email')).filter(email_lower='user@example.com')),
+        ('User by username, case-insensitive', models.User.objects.annotate(username_lower=Lower('username')).filter(username_lower='username')),
+        ('Steps of recipes', through_steps.filter(recipe_id__in=[1, 2, 3])),
+        ('Recipes of a step', through_steps.filter(step_id=1)),
+        ('Ingredients of recipes', through_ingredients.filter(recipe_id__in=[1, 2, 3])),
+        ('Recipes of an ingredient', through_ingredients.filter(ingredient_id=1)),
+        ('Step by normalized text', models.Step.objects.filter_text('Boil water')),
+        ('Ingredient by text prefix (admin search)', models.Ingredient.objects.filter_text_prefix('tom').order_by('text', '-pk')[:10]),
+    ]
+
+
+def explain_sqlite(connection, sql, params):
+    # "SCAN t" without an index is a full table scan. "USE TEMP B-TREE FOR ORDER BY" after a SCAN sorts every row; after a SEARCH it only sorts
+    # the matches of an index range, and "FOR RIGHT PART OF ORDER BY" is a partial sort on top of an ordered index.
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+        plan = [row[-1] for row in cursor.fetchall()]
+    problems = []
+    scans = [detail for detail in plan if detail.startswith('SCAN')]
+    for detail in scans:
+        if 'INDEX' not in detail:
+            problems.append(detail)
+    for detail in plan:
+        if 'USE TEMP B-TREE FOR ORDER BY' in detail and scans:
+            problems.append('%s (%s)' % (detail, scans[0]))
+    return plan, problems
+
+
+def explain_postgresql(connection, sql, params):
+    # Sequential scans are disabled for the check: on small tables they are the cheapest plan even when a usable index exists.
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN (FORMAT JSON) %s' % sql, params)
+        data = cursor.fetchone()[0]
+    if isinstance(data, str):
+        data = json.loads(data)
+    plan = []
+    problems = []
+    nodes = [(data[0]['Plan'], 0)]
+    while nodes:
+        node, depth = nodes.pop()
+        plan.append('%s%s %s' % ('  ' * depth, node['Node Type'], node.get('Relation Name', '')))
+        if node['Node Type'] == 'Seq Scan':
+            problems.append('Seq Scan on %s' % node.get('Relation Name'))
+        if node['Node Type'] == 'Sort':
+            problems.append('Sort on %s' % ', '.join(node.get('Sort Key', [])))
+        nodes.extend((child, depth + 1) for child in reversed(node.get('Plans', [])))
+    return plan, problems
+
+
+EXPLAINERS = {
+    'sqlite': explain_sqlite,
+    'postgresql': explain_postgresql,
+}
+
+
+def explain(connection, queryset):
+    # (plan lines, problems): a problem is a full table scan or a sort of every row. Also run by the test suite (genius_plaza.tests).
+    if connection.vendor not in EXPLAINERS:
+        raise NotImplementedError('EXPLAIN checks are only implemented for SQLite and PostgreSQL.')
+    sql, params = queryset.query.sql_with_params()
+    return EXPLAINERS[connection.vendor](connection, sql, params)
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the hot lookup queries and fails when one of them scans a whole table or sorts all of its rows.'
+
+    def handle(self, *args, **options):
+        connection = connections[router.db_for_read(models.Recipe)]
+        if connection.vendor not in EXPLAINERS:
+            raise CommandError('EXPLAIN checks are only implemented for SQLite and PostgreSQL.')
+        failures = []
+        for label, queryset in get_hot_queries():
+            plan, problems = explain(connection, queryset)
+            self.stdout.write('%s %s' % ('FAIL' if problems else 'ok  ', label))
+            for line in plan:
+                self.stdout.write('      %s' % line)
+            if problems:
+                failures.append('%s: %s' % (label, '; '.join(problems)))
+        if failures:
+            raise CommandError('Hot queries without a usable index:\n%s' % '\n'.join(failures))
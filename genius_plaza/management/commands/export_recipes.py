@@ -0,0 +1,36 @@
+import resource
+import sys
+import time
+from django.core.management.base import BaseCommand
+from genius_plaza import bulk, export
+
+
+class Command(BaseCommand):
+    help = 'Streams every recipe as NDJSON or CSV to a file (or stdout) in constant memory, then reports rows/sec and peak RSS on stderr.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default='ndjson')
+        parser.add_argument('--output', default='-', help='File to write; - for stdout.')
+        parser.add_argument('--chunk-size', type=int, default=bulk.BATCH_SIZE, help='Recipes per query chunk.')
+
+    def handle(self, *args, **options):
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        rows = []
+
+        def counted(chunks):
+            for chunk in chunks:
+                rows.append(len(chunk))
+                yield chunk
+
+        start = time.perf_counter()
+        try:
+            for data in export.encode(options['format'], counted(export.iter_recipe_chunks(chunk_size=options['chunk_size']))):
+                output.write(data)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        seconds = time.perf_counter() - start
+        rows = sum(rows)
+        self.stderr.write('Exported %s recipes in %.2fs (%s rows/sec), peak RSS %s KB.' % (
+            rows, seconds, round(rows / seconds, 1) if seconds else None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        ))
@@ -0,0 +1,90 @@
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import time
+from django.core.management.base import BaseCommand, CommandError
+from genius_plaza import bulk, importer
+
+
+class Command(BaseCommand):
+    help = 'Streams recipes from a JSON, NDJSON or CSV file into the database in batches, optionally resuming from a checkpoint, and reports rows/sec and peak memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import (the format is guessed from the extension unless --format is given).')
+        parser.add_argument('--format', choices=importer.FORMATS, default=None)
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE, help='Records per transaction.')
+        parser.add_argument('--workers', type=int, default=0, help='Processes parsing and validating records; 0 parses in this process.')
+        parser.add_argument('--checkpoint', default=None, help='File recording the records done after every committed batch; an existing one for the same file resumes the import.')
+        parser.add_argument('--max-errors', type=int, default=20, help='Rejected records listed in the report.')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        format = options['format'] or importer.guess_format(path)
+        done = self.read_checkpoint(options['checkpoint'], path)
+        if done:
+            self.stderr.write('Resuming after record %s.' % done)
+        imported = 0
+        rejected = []
+        rejected_count = 0
+        start = time.perf_counter()
+        pool = multiprocessing.Pool(options['workers']) if options['workers'] > 0 else None
+        try:
+            with open(path, newline='' if format == 'csv' else None, encoding='utf-8') as stream:
+                raw_records = itertools.islice(importer.read_raw_records(stream, format), done, None)
+                raw_batches = iter(lambda: list(itertools.islice(raw_records, options['batch_size'])), [])
+                if pool is not None:
+                    parsed_batches = self.parse_in_pool(pool, format, raw_batches, options['workers'] * 2)
+                else:
+                    parsed_batches = (importer.parse_batch(format, raw_batch) for raw_batch in raw_batches)
+                for parsed in parsed_batches:
+                    errors = [(number, error) for number, record, error in parsed if error is not None]
+                    pks, write_errors = importer.write_batch([(number, record) for number, record, error in parsed if error is None])
+                    errors += write_errors
+                    imported += len(pks)
+                    rejected_count += len(errors)
+                    rejected.extend(errors[:max(options['max_errors'] - len(rejected), 0)])
+                    done = parsed[-1][0]
+                    self.write_checkpoint(options['checkpoint'], path, done)
+        except (OSError, ValueError) as exc:
+            raise CommandError('%s (after record %s; rerun with the same --checkpoint to resume).' % (exc, done))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        seconds = time.perf_counter() - start
+        for number, error in sorted(rejected):
+            self.stderr.write('Record %s rejected: %s' % (number, error))
+        self.stdout.write('Imported %s recipes, rejected %s records in %.2fs (%s rows/sec), peak RSS %s KB.' % (
+            imported, rejected_count, seconds, round((imported + rejected_count) / seconds, 1) if seconds else None,
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        ))
+
+    def parse_in_pool(self, pool, format, raw_batches, window):
+        # In order, with at most window batches in flight: Pool.imap() would read the whole file ahead into its task queue.
+        pending = collections.deque()
+        for raw_batch in raw_batches:
+            pending.append(pool.apply_async(importer.parse_batch, (format, raw_batch)))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def read_checkpoint(self, checkpoint, path):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as stream:
+            data = json.load(stream)
+        if data.get('path') != path:
+            raise CommandError('The checkpoint %s belongs to %s.' % (checkpoint, data.get('path')))
+        return data['records']
+
+    def write_checkpoint(self, checkpoint, path, records):
+        # Written to a temporary file and renamed, so a crash leaves either the previous or the new checkpoint.
+        if not checkpoint:
+            return
+        with open(checkpoint + '.tmp', 'w') as stream:
+            json.dump({'path': path, 'records': records}, stream)
+        os.replace(checkpoint + '.tmp', checkpoint)
@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from genius_plaza import bulk, indexes, models, signals
+
+
+class Command(BaseCommand):
+    help = 'Merges steps and ingredients with the same normalized text into the oldest one, fills their normalized columns and adds the unique indexes (run after migrate).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE, help='Rows (or duplicate groups) per transaction.')
+        parser.add_argument('--dry-run', action='store_true', default=False, help='Only report the duplicates.')
+
+    def handle(self, *args, **options):
+        for model in (models.Step, models.Ingredient):
+            field = model.objects.get_normalized_field()
+            # Merged first: filling the column of two rows that normalize alike would break the unique index (present on databases that had no
+            # duplicates stored when it was created).
+            groups, merged = self.merge(model, field, options['batch_size'], options['dry_run'])
+            normalized = self.normalize(model, field, options['batch_size'], options['dry_run'])
+            self.stdout.write('%s: %s duplicate groups, %s rows merged, %s normalized%s.' % (
+                model._meta.verbose_name_plural, groups, merged, normalized, ' (dry run)' if options['dry_run'] else ''
+            ))
+        if not options['dry_run']:
+            indexes.install(router.db_for_write(models.Step))
+
+    def get_replacements(self, model, field):
+        # ({duplicate pk: kept pk}, duplicate groups), grouping on the text itself: the stored column may be NULL or stale.
+        keep = {}
+        replacements = {}
+        for pk, text in model.objects.order_by('pk').values_list('pk', field.source).iterator():
+            normalized = models.normalize_text(text)[:field.max_length]
+            if normalized in keep:
+                replacements[pk] = keep[normalized]
+            else:
+                keep[normalized] = pk
+        return replacements, len(set(replacements.values()))
+
+    def normalize(self, model, field, batch_size, dry_run):
+        # Keyset walk over the table; only rows whose stored value is missing or stale are updated.
+        changed = 0
+        last_pk = 0
+        while True:
+            instances = list(model.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', field.source, field.name)[:batch_size])
+            if len(instances) == 0:
+                return changed
+            last_pk = instances[-1].pk
+            stale = [instance for instance in instances if getattr(instance, field.attname) != models.normalize_text(getattr(instance, field.source))[:field.max_length]]
+            changed += len(stale)
+            if not dry_run:
+                with transaction.atomic():
+                    bulk.bulk_update(model, stale, [field.name])
+
+    def merge(self, model, field, batch_size, dry_run):
+        relations = [relation for relation in models.Recipe._meta.many_to_many if relation.related_model is model]
+        replacements, groups = self.get_replacements(model, field)
+        if dry_run:
+            return groups, len(replacements)
+        for batch in bulk.chunks(replacements, batch_size):
+            batch_replacements = dict((pk, replacements[pk]) for pk in batch)
+            with bulk.atomic_write():
+                for relation in relations:
+                    recipe_ids = self.rewire(relation, batch_replacements)
+                    signals.send_recipes_changed(recipe_ids, (relation.name,))
+                model.objects.filter(pk__in=batch).delete()
+        return groups, len(replacements)
+
+    def rewire(self, relation, replacements):
+        # Points the through rows of the duplicates at the kept row, skipping pairs the recipe already has.
+        through = relation.remote_field.through
+        source = '%s_id' % relation.m2m_field_name()
+        target = '%s_id' % relation.m2m_reverse_field_name()
+        pairs = set()
+        for pks in bulk.chunks(replacements):
+            pairs.update((source_pk, replacements[target_pk]) for source_pk, target_pk in through.objects.filter(**{target + '__in': pks}).values_list(source, target))
+        existing = set()
+        for pks in bulk.chunks(set(source_pk for source_pk, target_pk in pairs)):
+            existing.update(through.objects.filter(**{source + '__in': pks}).values_list(source, target))
+        bulk.bulk_add_m2m(models.Recipe, relation.name, sorted(pairs - existing))
+        for pks in bulk.chunks(replacements):
+            through.objects.filter(**{target + '__in': pks}).delete()
+        recipe_ids = set(source_pk for source_pk, target_pk in pairs)
+        # Recipes that already had the kept row only lost a through row, which bulk_add_m2m() did not report.
+        bulk.rows_written.send(sender=models.Recipe, pks=sorted(recipe_ids), created=False)
+        return recipe_ids
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from genius_plaza import bulk, fulltext, models
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index (FTS5 on SQLite, tsvector on PostgreSQL) over recipe names, steps and ingredients.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE, help='Recipes per batch.')
+
+    def handle(self, *args, **options):
+        using = router.db_for_write(models.Recipe)
+        backend = fulltext.get_backend(using)
+        if backend is None:
+            self.stdout.write('No full-text backend for the "%s" database.' % connections[using].vendor)
+            return
+        recipes = 0
+        with transaction.atomic(using=using):
+            backend.install(connections[using])
+            with connections[using].cursor() as cursor:
+                cursor.execute('DELETE FROM %s' % backend.table)
+            last_pk = 0
+            while True:
+                pks = list(models.Recipe.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+                if len(pks) == 0:
+                    break
+                fulltext.index_recipes(pks, batch_size=options['batch_size'], replace=False)
+                recipes += len(pks)
+                last_pk = pks[-1]
+        self.stdout.write('Indexed %s recipes.' % recipes)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from genius_plaza import bulk, models, search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the ingredient term -> recipe inverted index used by /genius-plaza/recipes/search/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE, help='Recipes per batch.')
+
+    def handle(self, *args, **options):
+        recipes = 0
+        with transaction.atomic():
+            models.RecipeIngredientTerm.objects.all().delete()
+            last_pk = 0
+            while True:
+                pks = list(models.Recipe.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+                if len(pks) == 0:
+                    break
+                search.index_recipes(pks, batch_size=options['batch_size'], replace=False)
+                recipes += len(pks)
+                last_pk = pks[-1]
+        self.stdout.write('Indexed %s recipes, %s terms.' % (recipes, models.RecipeIngredientTerm.objects.count()))
@@ -0,0 +1,32 @@
+from concurrent import futures
+from django.core.management.base import BaseCommand
+from django.db import connections
+from genius_plaza import bulk, documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored document of every recipe (served by the recipe detail endpoints), batches rebuilt in parallel by worker threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE, help='Recipes per batch (and per transaction).')
+        parser.add_argument('--workers', type=int, default=4, help='Batches rebuilt at the same time. SQLite runs their writes one at a time.')
+
+    def handle(self, *args, **options):
+        rebuilt = 0
+        with futures.ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            pending = set()
+            # A bounded number of batches in flight: the pks are read ahead of the workers, not all at once.
+            for pks in documents.iter_batches(options['batch_size']):
+                if len(pending) >= options['workers'] * 2:
+                    done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    rebuilt += sum(future.result() for future in done)
+                pending.add(executor.submit(self.rebuild_batch, pks))
+            rebuilt += sum(future.result() for future in futures.as_completed(pending))
+        self.stdout.write('Rebuilt %s recipe documents.' % rebuilt)
+
+    def rebuild_batch(self, pks):
+        try:
+            return documents.rebuild(pks, batch_size=len(pks))
+        finally:
+            # Each worker thread has its own connections.
+            connections.close_all()
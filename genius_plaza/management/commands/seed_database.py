@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from genius_plaza import benchmarks, models
+
+
+class Command(BaseCommand):
+    help = 'Seeds the configured database with users, steps, ingredients and recipes for local load testing (see "benchmark api"), then builds the search indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--steps', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--clear', action='store_true', help='Delete every user, recipe, step and ingredient first.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            with transaction.atomic():
+                for model in (models.Recipe, models.Step, models.Ingredient, models.User):
+                    model.objects.all().delete()
+        elif models.User.objects.filter(username='seed_0').exists():
+            raise CommandError('The database is already seeded; use --clear to start over.')
+        benchmarks.seed_recipes(options['recipes'], users=options['users'], steps=options['steps'], ingredients=options['ingredients'])
+        benchmarks.index_recipes()
+        self.stdout.write('Seeded %s users, %s steps, %s ingredients and %s recipes.' % (
+            options['users'], options['steps'], options['ingredients'], options['recipes'],
+        ))
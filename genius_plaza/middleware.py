@@ -0,0 +1,123 @@
+import gzip
+import re
+import time
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.db import connections
+from . import instrumentation, routers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_DEFAULTS = {
+    'ENABLED': True,
+    # Bodies shorter than this are sent as they are: compressing them costs more CPU than it saves on the wire.
+    'MIN_LENGTH': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    # API payloads only. HTML pages (admin, browsable API) carry CSRF tokens next to reflected input, which compression exposes to BREACH.
+    'CONTENT_TYPES': ('application/json', 'application/x-ndjson'),
+}
+
+
+class InstrumentationMiddleware(object):
+    # Per-route latency, query count, DB / serializer / render time and response size (see instrumentation.py), a Server-Timing header on every
+    # response and a warning for statements repeated within one request. First in MIDDLEWARE, so the latency covers the other middleware too.
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not instrumentation.get_setting('ENABLED'):
+            return self.get_response(request)
+        for connection in connections.all():
+            instrumentation.install(connection)
+        stats = instrumentation.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.stop()
+        total = time.perf_counter() - stats.start
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None else 'unmatched'
+        n_plus_one = stats.get_n_plus_one(instrumentation.get_setting('N_PLUS_ONE_THRESHOLD'))
+        if n_plus_one:
+            count, sql = n_plus_one[0]
+            instrumentation.logger.warning('Possible N+1 on %s %s (%s): %s runs of %s', request.method, request.path, route, count, sql)
+        instrumentation.metrics.observe(
+            (route, request.method, response.status_code), total, stats, 0 if response.streaming else len(response.content), 1 if n_plus_one else 0
+        )
+        response['Server-Timing'] = instrumentation.server_timing(stats, total)
+        return response
+
+    def process_template_response(self, request, response):
+        # Runs last among the middleware, right before the response (a DRF Response too) is rendered: the rendering is timed up to its post-render callback.
+        stats = instrumentation.get_current()
+        if stats is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                stats.timings['render'] = stats.timings.get('render', 0.0) + time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaRoutingMiddleware(object):
+    # Safe requests (the read-only viewset actions: list, retrieve, search, autocomplete) read from the replicas. An unsafe request stays on the
+    # primary and sets a short-lived cookie, so the same client keeps reading from the primary, and sees its own writes, until the replicas caught up.
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    cookie_name = 'genius_plaza_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not routers.get_replicas():
+            return self.get_response(request)
+        safe = request.method in self.safe_methods
+        with routers.use_replicas(safe and self.cookie_name not in request.COOKIES):
+            response = self.get_response(request)
+        if not safe:
+            response.set_cookie(self.cookie_name, '1', max_age=getattr(settings, 'DATABASE_REPLICA_LAG', 5), httponly=True)
+        return response
+
+
+def get_compression_setting(name):
+    return getattr(settings, 'GENIUS_PLAZA_COMPRESSION', {}).get(name, COMPRESSION_DEFAULTS[name])
+
+
+class CompressionMiddleware(object):
+    # Large JSON bodies compressed with brotli (when installed and accepted) or gzip. Comes after InstrumentationMiddleware, whose response
+    # size is then the size on the wire. The ETag is made weak, as django.middleware.gzip does: conditional GETs compare weakly and keep matching.
+    accept_re = re.compile(r'\b(br|gzip)\b')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not get_compression_setting('ENABLED') or response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < get_compression_setting('MIN_LENGTH'):
+            return response
+        if not response.get('Content-Type', '').startswith(tuple(get_compression_setting('CONTENT_TYPES'))):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = set(self.accept_re.findall(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        if 'br' in accepted and brotli is not None:
+            encoding, content = 'br', brotli.compress(response.content, quality=get_compression_setting('BROTLI_QUALITY'))
+        elif 'gzip' in accepted:
+            encoding, content = 'gzip', gzip.compress(response.content, compresslevel=get_compression_setting('GZIP_LEVEL'), mtime=0)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -1,5 +1,37 @@
-from django.db import models
-from passlib.handlers import django as passlib_django
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Lower
+from . import bulk, passwords
+
+
+def normalize_text(text):
+    # Case and whitespace folded form used to de-duplicate steps and ingredients: '  Sea  SALT ' -> 'sea salt'.
+    return ' '.join(str(text).split()).casefold()
+
+
+class NormalizedTextField(models.CharField):
+    # Copy of another text field, normalized with normalize_text() whenever the row is saved or bulk inserted. Two rows cannot hold the same text,
+    # whatever the writers racing to create it: genius_plaza.indexes adds the unique index after migrate. The column itself is nullable and not
+    # unique, so the migration adding it to a populated table succeeds; merge_duplicates then merges the rows and fills it (NULL until then).
+    def __init__(self, *args, **kwargs):
+        self.source = kwargs.pop('source')
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('editable', False)
+        super(NormalizedTextField, self).__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(NormalizedTextField, self).deconstruct()
+        kwargs['source'] = self.source
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = normalize_text(getattr(model_instance, self.source))[:self.max_length]
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+def prefix_upper_bound(prefix):
+    # Smallest string greater than every string starting with prefix, so "starts with" becomes an index range scan on any backend.
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
 
 
 class UserManager(models.Manager):
@@ -27,6 +59,131 @@ class UserManager(models.Manager):
             return None
         return instance
 
+    def get_user_by_username_ci(self, username):
+        # Case-insensitive lookups compare LOWER(column), which the genius_plaza.indexes expression indexes cover.
+        return self.annotate(username_lower=Lower('username')).filter(username_lower=username.lower()).order_by('id').first()
+
+    def get_user_by_email_ci(self, email):
+        return self.annotate(email_lower=Lower('email')).filter(email_lower=email.lower()).order_by('id').first()
+
+    def get_users_by_usernames(self, usernames):
+        # {username: user} for the ones that exist, one query per batch; only id and username are loaded.
+        result = {}
+        for batch in bulk.chunks(set(usernames)):
+            result.update((instance.username, instance) for instance in self.filter(username__in=batch).only('id', 'username'))
+        return result
+
+    def get_users_by_emails(self, emails):
+        # {email: user} for the ones that exist, one query per batch; only id and email are loaded.
+        result = {}
+        for batch in bulk.chunks(set(emails)):
+            result.update((instance.email, instance) for instance in self.filter(email__in=batch).only('id', 'email'))
+        return result
+
+
+class NormalizedTextQuerySet(models.QuerySet):
+    def get_normalized_field(self):
+        for field in self.model._meta.concrete_fields:
+            if isinstance(field, NormalizedTextField):
+                return field
+
+    def filter_text(self, text):
+        return self.filter(**{self.get_normalized_field().name: normalize_text(text)})
+
+    def filter_text_prefix(self, prefix):
+        prefix = normalize_text(prefix)
+        if not prefix:
+            return self.all()
+        name = self.get_normalized_field().name
+        return self.filter(**{name + '__gte': prefix, name + '__lt': prefix_upper_bound(prefix)})
+
+
+class NormalizedTextManager(models.Manager.from_queryset(NormalizedTextQuerySet)):
+    def get_by_text(self, text):
+        return self.filter_text(text).order_by('id').first()
+
+    def get_or_create_by_text(self, text):
+        instance = self.get_by_text(text)
+        if instance is not None:
+            return instance, False
+        try:
+            # In a savepoint: when a concurrent writer created the same text since the lookup, the unique column rejects this one and theirs is used.
+            with transaction.atomic(using=self.db):
+                return self.create(**{self.get_normalized_field().source: text}), True
+        except IntegrityError:
+            instance = self.get_by_text(text)
+            if instance is None:
+                raise
+            return instance, False
+
+    def get_or_create_by_texts(self, texts, attempts=3):
+        # One lookup per batch of distinct normalized texts plus one bulk INSERT for the missing ones; returns instances aligned with texts.
+        field = self.get_normalized_field()
+        texts = list(texts)
+        originals = {}
+        for text in texts:
+            originals.setdefault(normalize_text(text)[:field.max_length], text)
+        instances = {}
+        for attempt in range(1, attempts + 1):
+            for batch in bulk.chunks(normalized for normalized in originals if normalized not in instances):
+                for instance in self.filter(**{field.name + '__in': batch}).order_by():
+                    instances[getattr(instance, field.attname)] = instance
+            missing = [self.model(**{field.source: originals[normalized]}) for normalized in originals if normalized not in instances]
+            try:
+                # In a savepoint, as above: a text created concurrently fails the INSERT, and the missing texts are looked up again.
+                with transaction.atomic(using=self.db):
+                    bulk.bulk_create(self.model, missing)
+            except IntegrityError:
+                if attempt == attempts:
+                    raise
+                continue
+            break
+        for instance in missing:
+            instances[getattr(instance, field.attname)] = instance
+        return [instances[normalize_text(text)[:field.max_length]] for text in texts]
+
+
+class RecipeManager(models.Manager):
+    def get_queryset(self):
+        # The document is only read by the detail endpoints (see documents.get_document()).
+        return super(RecipeManager, self).get_queryset().defer('document')
+
+    def get_recipes(self):
+        return self.all().select_related('user').prefetch_related('steps', 'ingredients')
+
+    def get_recipes_by_user(self, with_document=False, **lookup):
+        # A user's recipes joined to the user columns RecipeReadSerializer shows (the password hash and the rest stay deferred), and their stored
+        # document with with_document; steps/ingredients come from prefetch_steps_and_ingredients() once the page is cut.
+        fields = ['id', 'name', 'user__id', 'user__first_name', 'user__last_name', 'user__username'] + (['document'] if with_document else [])
+        return self.filter(**dict(('user__%s' % name, value) for name, value in lookup.items())).select_related('user').defer(None).only(*fields)
+
+    def prefetch_steps_and_ingredients(self, recipes):
+        # prefetch_related('steps', 'ingredients') in one query instead of two: both through tables joined to their texts under a UNION ALL,
+        # loaded into each recipe's prefetch cache as instances with only id and text.
+        recipes = list(recipes)
+        if len(recipes) == 0:
+            return recipes
+        pks = [recipe.pk for recipe in recipes]
+        relations = (('steps', Step, 'step_text'), ('ingredients', Ingredient, 'text'))
+        querysets = [
+            getattr(Recipe, name).through.objects.using(self.db).filter(recipe_id__in=pks).annotate(
+                relation=models.Value(name, output_field=models.CharField())
+            ).values_list('recipe_id', '%s_id' % model._meta.model_name, '%s__%s' % (model._meta.model_name, field), 'relation')
+            for name, model, field in relations
+        ]
+        related = {}
+        for recipe_id, pk, text, name in querysets[0].union(*querysets[1:], all=True):
+            related.setdefault((name, recipe_id), []).append((pk, text))
+        for recipe in recipes:
+            if not hasattr(recipe, '_prefetched_objects_cache'):
+                recipe._prefetched_objects_cache = {}
+            for name, model, field in relations:
+                queryset = getattr(recipe, name).all()
+                queryset._result_cache = [model.from_db(self.db, ['id', field], row) for row in sorted(related.get((name, recipe.pk), []))]
+                queryset._prefetch_done = True
+                recipe._prefetched_objects_cache[name] = queryset
+        return recipes
+
 
 class User(models.Model):
     id = models.AutoField(
@@ -82,6 +239,7 @@ class User(models.Model):
         auto_now_add=False,
         auto_now=True,
         editable=True,
+        db_index=True,
         verbose_name='Modified'
     )
 
@@ -90,6 +248,11 @@ class User(models.Model):
     class Meta:
         db_table = 'genius_plaza_user'
         ordering = ['id', ]
+        indexes = [
+            # UserManager.get_users() and UserAdmin.ordering.
+            models.Index(fields=['first_name', 'username'], name='gp_user_first_username_idx'),
+            models.Index(fields=['first_name', 'last_name'], name='gp_user_first_last_idx'),
+        ]
         verbose_name_plural = 'Users'
         verbose_name = 'User'
 
@@ -105,10 +268,15 @@ class User(models.Model):
         return super(User, self).save(*args, **kwargs)
 
     def encrypt_password(self, password):
-        self.password = passlib_django.django_pbkdf2_sha256.encrypt(password)
+        self.password = passwords.hash_password(password)
 
     def verify_password(self, password):
-        return passlib_django.django_pbkdf2_sha256.verify(password, self.password)
+        verified, new_hash = passwords.verify_and_update(password, self.password)
+        if verified and new_hash is not None:
+            # Lazy upgrade to the current scheme and cost; a plain UPDATE, so no post_save (and no recipe invalidation) for a password rehash.
+            self.password = new_hash
+            User.objects.filter(pk=self.pk).update(password=new_hash)
+        return verified
 
 
 class Recipe(models.Model):
@@ -140,10 +308,31 @@ class Recipe(models.Model):
         blank=True,
         verbose_name='Ingredients'
     )
+    modified = models.DateTimeField(
+        auto_now_add=False,
+        auto_now=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Modified'
+    )
+    # The recipe as the detail endpoints show it (JSON), maintained by genius_plaza.documents; NULL until built.
+    document = models.TextField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Document'
+    )
+
+    objects = RecipeManager()
 
     class Meta:
         db_table = 'genius_plaza_recipe'
         ordering = ['id', ]
+        indexes = [
+            # RecipeAdmin.ordering, and a user's recipes in id order (recipe-by-user views).
+            models.Index(fields=['name'], name='gp_recipe_name_idx'),
+            models.Index(fields=['user', 'id'], name='gp_recipe_user_id_idx'),
+        ]
         verbose_name_plural = 'Recipes'
         verbose_name = 'Recipe'
 
@@ -162,6 +351,22 @@ class Step(models.Model):
         blank=False,
         verbose_name='Step-text'
     )
+    step_text_normalized = NormalizedTextField(
+        source='step_text',
+        max_length=100,
+        null=True,
+        blank=True,
+        verbose_name='Step-text (normalized)'
+    )
+    modified = models.DateTimeField(
+        auto_now_add=False,
+        auto_now=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Modified'
+    )
+
+    objects = NormalizedTextManager()
 
     class Meta:
         db_table = 'genius_plaza_step'
@@ -184,6 +389,22 @@ class Ingredient(models.Model):
         blank=False,
         verbose_name='Ingredient-text'
     )
+    text_normalized = NormalizedTextField(
+        source='text',
+        max_length=100,
+        null=True,
+        blank=True,
+        verbose_name='Ingredient-text (normalized)'
+    )
+    modified = models.DateTimeField(
+        auto_now_add=False,
+        auto_now=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Modified'
+    )
+
+    objects = NormalizedTextManager()
 
     class Meta:
         db_table = 'genius_plaza_ingredient'
@@ -193,3 +414,86 @@ class Ingredient(models.Model):
 
     def __str__(self):
         return self.text
+
+
+class RecipeIngredientTerm(models.Model):
+    # Inverted index: one row per (ingredient word, recipe), maintained by genius_plaza.search.
+    id = models.AutoField(
+        primary_key=True
+    )
+    term = models.CharField(
+        max_length=100,
+        null=False,
+        blank=False,
+        verbose_name='Term'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='ingredient_term',
+        on_delete=models.CASCADE,
+        blank=False,
+        null=False,
+        verbose_name='Recipe'
+    )
+
+    class Meta:
+        db_table = 'genius_plaza_recipe_ingredient_term'
+        ordering = ['id', ]
+        unique_together = (('term', 'recipe'),)
+        index_together = (('recipe', 'term'),)
+        verbose_name_plural = 'Recipe ingredient terms'
+        verbose_name = 'Recipe ingredient term'
+
+    def __str__(self):
+        return self.term
+
+
+class Change(models.Model):
+    # Append-only log of the rows created, updated and deleted, read by the change feed from a cursor (the id); see genius_plaza.changes.
+    ACTION_CREATE = 'create'
+    ACTION_UPDATE = 'update'
+    ACTION_DELETE = 'delete'
+    ACTIONS = (
+        (ACTION_CREATE, 'Create'),
+        (ACTION_UPDATE, 'Update'),
+        (ACTION_DELETE, 'Delete'),
+    )
+
+    id = models.BigAutoField(
+        primary_key=True
+    )
+    model_name = models.CharField(
+        max_length=20,
+        null=False,
+        blank=False,
+        verbose_name='Model'
+    )
+    object_id = models.IntegerField(
+        null=False,
+        blank=False,
+        verbose_name='Object id'
+    )
+    action = models.CharField(
+        max_length=10,
+        choices=ACTIONS,
+        null=False,
+        blank=False,
+        verbose_name='Action'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        auto_now=False,
+        editable=False,
+        verbose_name='Created'
+    )
+
+    class Meta:
+        db_table = 'genius_plaza_change'
+        ordering = ['id', ]
+        # Compaction groups the log by row.
+        index_together = (('model_name', 'object_id'),)
+        verbose_name_plural = 'Changes'
+        verbose_name = 'Change'
+
+    def __str__(self):
+        return '%s %s %s' % (self.action, self.model_name, self.object_id)
@@ -0,0 +1,117 @@
+import functools
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework import pagination
+
+
+def estimate_count(model, using):
+    # Row count from the planner statistics, without reading the table: pg_class.reltuples on PostgreSQL, sqlite_stat1 (filled by ANALYZE) on SQLite.
+    # None when the database has no estimate yet.
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [connection.ops.quote_name(table)])
+            row = cursor.fetchone()
+            return int(row[0]) if row is not None and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s ORDER BY idx IS NOT NULL LIMIT 1', [table])
+            except DatabaseError:
+                return None
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row is not None else None
+    return None
+
+
+class CountedPaginator(Paginator):
+    # Takes the row count from the caller when it already has one, instead of running its own COUNT(*).
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super(CountedPaginator, self).__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+
+class EstimatedCountPaginator(Paginator):
+    # For the admin changelists of big tables: the unfiltered list is counted with estimate_count() instead of a COUNT(*) over every row.
+    # Filtered lists, and tables the estimate puts under exact_count_limit rows, are still counted exactly.
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        estimate = None
+        if isinstance(self.object_list, QuerySet) and not self.object_list.query.where:
+            estimate = estimate_count(self.object_list.model, self.object_list.db)
+        if estimate is None or estimate < self.exact_count_limit:
+            return Paginator.count.func(self)
+        return estimate
+
+
+class PageNumberPagination(pagination.PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Views that have counted the rows already (see views.ConditionalGetMixin) pass the count on as view.paginator_count.
+        self.django_paginator_class = functools.partial(CountedPaginator, count=getattr(view, 'paginator_count', None))
+        return super(PageNumberPagination, self).paginate_queryset(queryset, request, view=view)
+
+
+class CursorPagination(pagination.CursorPagination):
+    # Keyset on the primary key (Meta.ordering = ['id'] on every model): each page is "WHERE id > cursor ORDER BY id LIMIT n", without COUNT(*) or OFFSET.
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class PageNumberOrCursorPagination(pagination.BasePagination):
+    # Page numbers by default, so existing clients keep working; cursor (keyset) pagination when the request asks for it with ?pagination=cursor or already carries a ?cursor=.
+    mode_query_param = 'pagination'
+    mode_cursor = 'cursor'
+    page_number_pagination_class = PageNumberPagination
+    cursor_pagination_class = CursorPagination
+
+    def __init__(self):
+        self.paginator = self.page_number_pagination_class()
+
+    def is_cursor_request(self, request):
+        if request.query_params.get(self.mode_query_param) == self.mode_cursor:
+            return True
+        return self.cursor_pagination_class.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_request(request):
+            self.paginator = self.cursor_pagination_class()
+        else:
+            self.paginator = self.page_number_pagination_class()
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    @property
+    def display_page_controls(self):
+        return self.paginator.display_page_controls
+
+    @property
+    def template(self):
+        return self.paginator.template
+
+    def get_html_context(self):
+        return self.paginator.get_html_context()
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_schema_fields(self, view):
+        fields = self.page_number_pagination_class().get_schema_fields(view)
+        names = set(field.name for field in fields)
+        for field in self.cursor_pagination_class().get_schema_fields(view):
+            if field.name not in names:
+                fields.append(field)
+        return fields
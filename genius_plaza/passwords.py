@@ -0,0 +1,193 @@
+import atexit
+import functools
+import logging
+import math
+import threading
+import time
+from concurrent import futures
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from passlib import registry
+from passlib.context import CryptContext
+
+DEFAULTS = {
+    # passlib schemes in order of preference: new hashes use the first one whose backend is installed, hashes of the others are upgraded on login.
+    # Every scheme stays in the context as long as it is listed, installed or not: its hashes are still identified, and verified once its backend is.
+    'SCHEMES': ('django_argon2', 'django_bcrypt_sha256', 'django_pbkdf2_sha256'),
+    # Explicit cost per scheme ({'django_pbkdf2_sha256': 100000}); wins over calibration.
+    'ROUNDS': {},
+    # Seconds one verification should take: the cost of the other schemes is raised (never below passlib's default) to meet it, once per process
+    # when the app is loaded (see apps.GeniusPlazaConfig.ready()).
+    # None keeps passlib's defaults.
+    'TARGET_TIME': None,
+    # Processes hashing and verifying passwords; 0 does it in the calling thread.
+    'WORKERS': 2,
+    # Seconds a request waits for the pool before it hashes in its own thread.
+    'TIMEOUT': 30,
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_setting(name):
+    return getattr(settings, 'GENIUS_PLAZA_PASSWORD_HASHING', {}).get(name, DEFAULTS[name])
+
+
+def get_available_schemes(schemes=None):
+    result = []
+    for name in schemes or get_setting('SCHEMES'):
+        handler = registry.get_crypt_handler(name)
+        if not hasattr(handler, 'has_backend') or handler.has_backend():
+            result.append(name)
+    return result
+
+
+def time_hash(handler, rounds, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        handler.using(rounds=rounds).hash('calibration password')
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate_rounds(handler, target_time):
+    # Rounds for which one hash (= one verification) takes about target_time on this host; linear (PBKDF2, Argon2 time cost) or log2 (bcrypt) cost.
+    rounds = handler.default_rounds
+    elapsed = time_hash(handler, rounds)
+    if handler.rounds_cost == 'log2':
+        rounds += int(math.floor(math.log(target_time / elapsed, 2))) if elapsed else 0
+    else:
+        rounds = int(rounds * target_time / elapsed) if elapsed else rounds
+    return min(max(rounds, handler.default_rounds), handler.max_rounds)
+
+
+def build_config():
+    schemes = tuple(get_setting('SCHEMES'))
+    available = get_available_schemes(schemes)
+    if len(available) == 0:
+        raise ImproperlyConfigured('None of the password hashing schemes %s has a backend installed.' % ', '.join(schemes))
+    missing = [name for name in schemes if name not in available]
+    if missing:
+        logger.warning('No backend installed for the password hashing schemes %s: their hashes cannot be verified.', ', '.join(missing))
+    explicit = get_setting('ROUNDS')
+    target_time = get_setting('TARGET_TIME')
+    rounds = []
+    for name in schemes:
+        handler = registry.get_crypt_handler(name)
+        if not hasattr(handler, 'default_rounds'):
+            continue
+        if name in explicit:
+            rounds.append((name, explicit[name]))
+        elif target_time and name in available:
+            rounds.append((name, calibrate_rounds(handler, target_time)))
+    return schemes, available[0], tuple(rounds)
+
+
+def get_config():
+    # Hashable (schemes, default scheme, ((scheme, rounds), ...)): computed once per process and handed to the pool with every call, so both sides
+    # use the same policy.
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = build_config()
+        return _config
+
+
+def reset_config():
+    global _config
+    with _config_lock:
+        _config = None
+
+
+@functools.lru_cache(maxsize=8)
+def get_context(config):
+    schemes, default, rounds = config
+    options = {}
+    for name, value in rounds:
+        handler = registry.get_crypt_handler(name)
+        options['%s__default_rounds' % name] = value
+        # Hashes a little under the policy are left alone: calibration differs by a few percent between processes and hosts.
+        options['%s__min_rounds' % name] = value - 1 if handler.rounds_cost == 'log2' else int(value * 0.9)
+    # deprecated=['auto']: every scheme but the default, so hashes of a scheme without a backend are upgraded as soon as they can be verified.
+    return CryptContext(schemes=list(schemes), default=default, deprecated=['auto'], **options)
+
+
+def identify(hash):
+    return get_context(get_config()).identify(hash)
+
+
+def _hash(password, config):
+    # Module level functions: they are pickled by reference into the pool processes.
+    return get_context(config).hash(password)
+
+
+def _verify_and_update(password, hash, config):
+    return get_context(config).verify_and_update(password, hash)
+
+
+def get_executor():
+    # Created on first use, so every WSGI worker process gets its own pool (forked after the worker, not before).
+    global _executor
+    if get_setting('WORKERS') <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = futures.ProcessPoolExecutor(max_workers=get_setting('WORKERS'))
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+atexit.register(shutdown)
+
+
+def discard_executor(executor):
+    # A broken pool is replaced on next use; its processes are gone or going, so nothing is waited for.
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def run(func, *args):
+    # The CPU-bound work runs in the pool; at most WORKERS hashes run at once and the rest queue, instead of every request thread burning a core.
+    # A pool that broke (a worker was killed) is replaced, and a hash still waiting after TIMEOUT seconds is taken back: either way the calling
+    # thread then does the work itself, so the request is slower rather than failed.
+    executor = get_executor()
+    if executor is not None:
+        future = None
+        try:
+            future = executor.submit(func, *args)
+            return future.result(timeout=get_setting('TIMEOUT'))
+        except futures.process.BrokenProcessPool:
+            discard_executor(executor)
+        except futures.TimeoutError:
+            future.cancel()
+    return func(*args)
+
+
+def hash_password(password):
+    return run(_hash, password, get_config())
+
+
+def verify_and_update(password, hash):
+    # (verified, new hash or None): a new hash when the password is right but was hashed with a deprecated scheme or too few rounds.
+    return run(_verify_and_update, password, hash, get_config())
+
+
+def verify_password(password, hash):
+    return verify_and_update(password, hash)[0]
@@ -0,0 +1,73 @@
+import codecs
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def get_backend():
+    # GENIUS_PLAZA_JSON_BACKEND: 'auto' (the first installed of BACKENDS), or one of them; a backend that is not installed falls back to 'json'.
+    name = getattr(settings, 'GENIUS_PLAZA_JSON_BACKEND', 'auto')
+    if name in ('auto', 'orjson') and orjson is not None:
+        return 'orjson'
+    if name in ('auto', 'ujson') and ujson is not None:
+        return 'ujson'
+    return 'json'
+
+
+_encoder = encoders.JSONEncoder()
+
+
+def encode_default(obj):
+    # Whatever the C encoders do not know (lazy translations in error messages, Decimal, UUID, querysets...) is converted like DRF's own encoder does.
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    # Same output as DRF's compact JSONRenderer (UTF-8, no whitespace), encoded with orjson or ujson when installed.
+    # "Accept: application/json; indent=4" keeps DRF's pretty-printing.
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        backend = get_backend()
+        if backend == 'json' or self.get_indent(accepted_media_type, renderer_context or {}) or not self.compact:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        if backend == 'orjson':
+            # Dates and times go through DRF's encoder too: orjson's own format differs (+00:00 instead of Z, microseconds kept).
+            ret = orjson.dumps(data, default=encode_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        else:
+            ret = ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False, default=encode_default).encode('utf-8')
+        # U+2028 / U+2029 are valid JSON but not valid JavaScript: escaped, as DRF does.
+        if b'\xe2\x80' in ret:
+            ret = ret.replace('\u2028'.encode('utf-8'), b'\\u2028').replace('\u2029'.encode('utf-8'), b'\\u2029')
+        return ret
+
+
+class FastJSONParser(parsers.JSONParser):
+    # Request bodies decoded with orjson or ujson when installed; other charsets than UTF-8 go through DRF's parser.
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        backend = get_backend()
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if backend == 'json' or codecs.lookup(encoding).name != 'utf-8':
+            return super(FastJSONParser, self).parse(stream, media_type, parser_context)
+        data = stream.read()
+        try:
+            if backend == 'orjson':
+                return orjson.loads(data)
+            return ujson.loads(data)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
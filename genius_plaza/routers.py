@@ -0,0 +1,38 @@
+import contextlib
+import random
+import threading
+from django.conf import settings
+
+_local = threading.local()
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextlib.contextmanager
+def use_replicas(enabled=True):
+    # Reads inside the block may go to a replica; see middleware.ReplicaRoutingMiddleware.
+    previous = getattr(_local, 'use_replicas', False)
+    _local.use_replicas = enabled
+    try:
+        yield
+    finally:
+        _local.use_replicas = previous
+
+
+class PrimaryReplicaRouter(object):
+    # Writes always go to the primary ('default'). Reads go to a random replica only inside use_replicas(), which the middleware opens for
+    # read-only requests of clients that have not just written: management commands, signal receivers and every unsafe request read their own writes.
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if replicas and getattr(_local, 'use_replicas', False):
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data.
+        return True
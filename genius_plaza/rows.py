@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models.fields.related import ForeignObjectRel
+from rest_framework import relations, serializers
+from . import bulk, instrumentation
+
+# Serializer fields whose output is the database value itself (int, str, bool): copied as they are instead of going through to_representation().
+IDENTITY_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.EmailField, serializers.BooleanField)
+
+COLUMN = 'column'
+NESTED = 'nested'
+RELATED = 'related'
+
+
+class Unsupported(Exception):
+    pass
+
+
+def get_model_field(model, field):
+    try:
+        model_field = model._meta.get_field(field.source)
+    except FieldDoesNotExist:
+        # Computed from the instance (source='*', a property, a method, a dotted path).
+        raise Unsupported(field.field_name)
+    if isinstance(model_field, ForeignObjectRel):
+        raise Unsupported(field.field_name)
+    return model_field
+
+
+def plan_fields(model, serializer, prefix, columns, related):
+    # [(key, kind, argument)] in the serializer's field order; appends the values() names it reads to columns and its many-to-many fields to related.
+    plan = []
+    for field in serializer._readable_fields:
+        model_field = get_model_field(model, field)
+        if model_field.many_to_many:
+            if related is None:
+                raise Unsupported(field.field_name)
+            plan.append((field.field_name, RELATED, len(related)))
+            related.append(RelatedReader(model_field, field))
+            continue
+        column = prefix + model_field.attname
+        if column not in columns:
+            columns.append(column)
+        if not model_field.is_relation:
+            plan.append((field.field_name, COLUMN, (column, None if type(field) in IDENTITY_FIELDS else field.to_representation)))
+        elif isinstance(field, serializers.ModelSerializer):
+            plan.append((field.field_name, NESTED, (column, plan_fields(model_field.related_model, field, prefix + model_field.name + '__', columns, None))))
+        elif isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is None:
+            plan.append((field.field_name, COLUMN, (column, None)))
+        else:
+            raise Unsupported(field.field_name)
+    return plan
+
+
+def build(plan, row, related, pk):
+    # What Serializer.to_representation() returns for the instance row was read from: None stays None, as the serializer leaves it.
+    ret = OrderedDict()
+    for key, kind, argument in plan:
+        if kind is COLUMN:
+            column, to_representation = argument
+            value = row[column]
+            ret[key] = value if value is None or to_representation is None else to_representation(value)
+        elif kind is NESTED:
+            column, nested = argument
+            ret[key] = None if row[column] is None else build(nested, row, None, None)
+        else:
+            ret[key] = related[argument].get(pk, [])
+    return ret
+
+
+class RelatedReader(object):
+    # {source pk: [each related row as the field shows it]}, from one query per batch of sources over the through table joined to the related table,
+    # in the related model's ordering (the order prefetch_related() gives).
+    def __init__(self, model_field, field):
+        self.through = model_field.remote_field.through
+        self.source = model_field.m2m_field_name() + '_id'
+        target = model_field.m2m_reverse_field_name()
+        related_model = model_field.related_model
+        self.columns = [self.source]
+        child = getattr(field, 'child', None)
+        child_relation = getattr(field, 'child_relation', None)
+        if isinstance(child, serializers.ModelSerializer):
+            self.plan = plan_fields(related_model, child, target + '__', self.columns, None)
+        elif isinstance(child_relation, relations.PrimaryKeyRelatedField) and child_relation.pk_field is None:
+            self.columns.append(target + '_id')
+            self.plan = None
+        else:
+            raise Unsupported(field.field_name)
+        self.ordering = [self.source]
+        for name in related_model._meta.ordering or [related_model._meta.pk.name]:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name == 'pk':
+                name = related_model._meta.pk.name
+            self.ordering.append('%s%s__%s' % ('-' if descending else '', target, name))
+
+    def read(self, pks, using):
+        # As many pks per query as the backend takes: one query for the whole list on PostgreSQL, batches on SQLite (999 parameters at most).
+        result = {}
+        for batch in bulk.chunks(pks, connections[using].ops.bulk_batch_size([self.source], pks) or 1):
+            rows = self.through._default_manager.using(using).filter(**{self.source + '__in': batch}).order_by(*self.ordering).values(*self.columns)
+            for row in rows:
+                result.setdefault(row[self.source], []).append(row[self.columns[1]] if self.plan is None else build(self.plan, row, None, None))
+        return result
+
+
+class RowReader(object):
+    # serializer.data for a list, built from values() and one query per many-to-many field (per batch of rows) instead of model instances
+    # and field objects per row. The serializer's readable fields decide the columns, so ?fields=/?expand= serializers are read the same way.
+    def __init__(self, serializer):
+        model = serializer.Meta.model
+        self.pk = model._meta.pk.attname
+        self.columns = [self.pk]
+        self.related = []
+        self.plan = plan_fields(model, serializer, '', self.columns, self.related)
+
+    def get_queryset(self, queryset):
+        # Rows are dicts, which cursor pagination reads its position from like it reads attributes of instances.
+        return queryset.select_related(None).prefetch_related(None).defer(None).values(*self.columns)
+
+    def read(self, rows, using):
+        with instrumentation.timer('serializer'):
+            rows = list(rows)
+            pks = [row[self.pk] for row in rows]
+            related = [reader.read(pks, using) for reader in self.related]
+            return [build(self.plan, row, related, row[self.pk]) for row in rows]
+
+
+def get_reader(serializer):
+    # RowReader for a (child) ModelSerializer, or None when one of its fields cannot be read from values(): the caller uses the serializer then.
+    try:
+        return RowReader(serializer)
+    except Unsupported:
+        return None
@@ -0,0 +1,70 @@
+import re
+from django.db.models import Exists, OuterRef, Q
+from . import bulk, models
+
+TERM_RE = re.compile(r'\w+')
+OPERATOR_OR = ('OR', '|')
+# Terms matching at most this many recipes are inlined as an id list; more frequent ones are probed per candidate recipe.
+RARE_TERM_RECIPES = 500
+
+
+def tokenize(text):
+    return set(TERM_RE.findall(models.normalize_text(text)))
+
+
+def index_recipes(recipe_ids, batch_size=bulk.BATCH_SIZE, replace=True):
+    # Recomputes the ingredient terms of the given recipes from the Recipe.ingredients through table; deleted recipes simply end up with no rows.
+    through = models.Recipe.ingredients.through
+    for batch in bulk.chunks(set(recipe_ids), batch_size):
+        if replace:
+            models.RecipeIngredientTerm.objects.filter(recipe_id__in=batch).delete()
+        rows = through.objects.filter(recipe_id__in=batch).values_list('recipe_id', 'ingredient__text')
+        terms = set((term, recipe_id) for recipe_id, text in rows for term in tokenize(text))
+        bulk.insert_rows(models.RecipeIngredientTerm, ['term', 'recipe'], sorted(terms))
+
+
+def parse_query(query):
+    # "eggs flour" -> eggs AND flour; "eggs OR butter" (or "|"); "-milk" -> NOT milk; "egg*" -> terms starting with egg.
+    # Returns a list of OR-ed groups, each a list of (negated, term, prefix).
+    groups = [[]]
+    for token in query.split():
+        if token in OPERATOR_OR:
+            groups.append([])
+            continue
+        negated = token.startswith('-')
+        prefix = token.endswith('*')
+        for term in TERM_RE.findall(models.normalize_text(token)):
+            groups[-1].append((negated, term, prefix))
+    groups = [group for group in groups if len(group) > 0]
+    if len(groups) == 0:
+        raise ValueError('Enter at least one ingredient term.')
+    return groups
+
+
+def get_term_queryset(term, prefix=False):
+    terms = models.RecipeIngredientTerm.objects.order_by()
+    if prefix:
+        return terms.filter(term__gte=term, term__lt=models.prefix_upper_bound(term))
+    return terms.filter(term=term)
+
+
+def filter_recipes(queryset, query):
+    # A rare term becomes "id IN (its few recipe ids)", read from the (term, recipe) index; a common one becomes an EXISTS probe on the (recipe, term) index,
+    # so a page ordered by id stops after a handful of matches instead of materializing a posting list of the size of the catalog.
+    condition = Q()
+    annotations = {}
+    for group in parse_query(query):
+        group_condition = Q()
+        for negated, term, prefix in group:
+            terms = get_term_queryset(term, prefix=prefix)
+            # Distinct: a prefix term matches a recipe through each of its terms under the prefix (egg, eggs).
+            recipe_ids = list(terms.values_list('recipe_id', flat=True).distinct()[:RARE_TERM_RECIPES + 1])
+            if len(recipe_ids) <= RARE_TERM_RECIPES:
+                term_condition = Q(pk__in=recipe_ids)
+            else:
+                name = 'ingredient_term_%s' % len(annotations)
+                annotations[name] = Exists(terms.filter(recipe_id=OuterRef('pk')).values('pk'))
+                term_condition = Q(**{name: True})
+            group_condition &= ~term_condition if negated else term_condition
+        condition |= group_condition
+    return queryset.annotate(**annotations).filter(condition)
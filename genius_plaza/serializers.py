@@ -1,9 +1,198 @@
-from genius_plaza import models
+from collections import OrderedDict
+from django.db import IntegrityError
+from genius_plaza import bulk, instrumentation, models, passwords, signals
 from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
 import re
 
 
-class UserSerializer(serializers.ModelSerializer):
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    # Resolves pks from context['related_objects'][model] when the caller preloaded them (bulk writes), instead of one query per pk.
+    def to_internal_value(self, data):
+        related_objects = self.context.get('related_objects')
+        if related_objects is None:
+            return super(PrefetchedPrimaryKeyRelatedField, self).to_internal_value(data)
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return related_objects[self.get_queryset().model][int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    @classmethod
+    def get_related_objects(cls, serializer, items):
+        related_pks = {}
+        for field in serializer.fields.values():
+            relation = getattr(field, 'child_relation', field)
+            if field.read_only or not isinstance(relation, cls):
+                continue
+            pks = related_pks.setdefault(relation.get_queryset().model, set())
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                values = item.get(field.field_name)
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    try:
+                        pks.add(int(value))
+                    except (TypeError, ValueError):
+                        pass
+        return dict((model, bulk.in_bulk(model._default_manager.all(), pks)) for model, pks in related_pks.items())
+
+
+class InstrumentedDataMixin(object):
+    # The representation is built when .data is first read: timed as the request's serializer time (see instrumentation.py).
+    @property
+    def data(self):
+        with instrumentation.timer('serializer'):
+            return super(InstrumentedDataMixin, self).data
+
+
+class SparseFieldsMixin(object):
+    # fields=[names] keeps only those readable fields; expand=[names] keeps the expandable_fields listed nested and turns the others into pks.
+    # Constructor arguments rather than context: with many=True they reach the child, and nested serializers keep all of their own fields.
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        self.requested_fields = kwargs.pop('fields', None)
+        self.expanded_fields = kwargs.pop('expand', None)
+        super(SparseFieldsMixin, self).__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super(SparseFieldsMixin, self).get_fields()
+        if self.expanded_fields is not None:
+            for name in self.expandable_fields:
+                if name in fields and name not in self.expanded_fields:
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, many=isinstance(fields[name], serializers.ListSerializer))
+        if self.requested_fields is not None:
+            for name in list(fields):
+                if name not in self.requested_fields:
+                    del fields[name]
+        return fields
+
+
+class InstrumentedListSerializer(InstrumentedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class BulkListSerializer(InstrumentedListSerializer):
+    # many=True writes with bulk INSERT/UPDATE and direct through-table inserts; the caller wraps save() in a transaction.
+    many_to_many_pks = None
+
+    def get_many_to_many_names(self):
+        return [field.name for field in self.child.Meta.model._meta.many_to_many if field.name in self.child.fields]
+
+    def split_many_to_many(self, validated_data):
+        names = self.get_many_to_many_names()
+        result = []
+        for attrs in validated_data:
+            attrs = dict(attrs)
+            relations = {}
+            for name in names:
+                if name in attrs:
+                    relations[name] = list(OrderedDict((obj.pk, obj) for obj in attrs.pop(name)).values())
+            result.append((attrs, relations))
+        return result
+
+    def get_saved_fields(self, data):
+        fields = set()
+        for attrs, relations in data:
+            fields.update(attrs)
+            fields.update(relations)
+        return fields
+
+    def save_many_to_many(self, instances, relations, clear=False):
+        model = self.child.Meta.model
+        for name in self.get_many_to_many_names():
+            changed = [(instance, related[name]) for instance, related in zip(instances, relations) if name in related]
+            if clear:
+                bulk.bulk_clear_m2m(model, name, [instance.pk for instance, objs in changed])
+            bulk.bulk_add_m2m(model, name, [(instance.pk, obj.pk) for instance, objs in changed for obj in objs])
+        # Read the relations back with one through-table query per field instead of a per-instance prefetch.
+        self.many_to_many_pks = dict(
+            (name, bulk.m2m_pks(model, name, [instance.pk for instance in instances])) for name in self.get_many_to_many_names()
+        )
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        data = self.split_many_to_many(validated_data)
+        instances = [model(**attrs) for attrs, relations in data]
+        bulk.bulk_create(model, instances)
+        self.save_many_to_many(instances, [relations for attrs, relations in data])
+        signals.send_bulk_saved(model, [instance.pk for instance in instances], self.get_saved_fields(data), created=True)
+        return instances
+
+    def update(self, instances, validated_data):
+        model = self.child.Meta.model
+        data = self.split_many_to_many(validated_data)
+        fields = set()
+        for instance, (attrs, relations) in zip(instances, data):
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+                fields.add(name)
+        bulk.bulk_update(model, instances, sorted(fields))
+        self.save_many_to_many(instances, [relations for attrs, relations in data], clear=True)
+        signals.send_bulk_saved(model, [instance.pk for instance in instances], self.get_saved_fields(data), created=False)
+        return instances
+
+    def to_representation(self, data):
+        if self.many_to_many_pks is None:
+            return super(BulkListSerializer, self).to_representation(data)
+        result = []
+        for instance in data:
+            ret = OrderedDict()
+            for field in self.child._readable_fields:
+                if field.field_name in self.many_to_many_pks:
+                    ret[field.field_name] = self.many_to_many_pks[field.field_name].get(instance.pk, [])
+                    continue
+                attribute = field.get_attribute(instance)
+                check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+                ret[field.field_name] = None if check_for_none is None else field.to_representation(attribute)
+            result.append(ret)
+        return result
+
+
+def save_unique_text(model, save):
+    # Steps and ingredients are unique by normalized text: renaming one to the text of another is a validation error, not an IntegrityError.
+    try:
+        with bulk.atomic_write(using=model.objects.db):
+            return save()
+    except IntegrityError:
+        raise serializers.ValidationError({model.objects.get_normalized_field().source: [
+            'A %s with this text (compared case and whitespace folded) already exists.' % model._meta.verbose_name.lower()
+        ]})
+
+
+class NormalizedTextListSerializer(BulkListSerializer):
+    # Bulk creation of steps/ingredients reuses existing rows with the same normalized text.
+    def create(self, validated_data):
+        manager = self.child.Meta.model.objects
+        source = manager.get_normalized_field().source
+        return manager.get_or_create_by_texts([attrs[source] for attrs in validated_data])
+
+    def update(self, instances, validated_data):
+        return save_unique_text(self.child.Meta.model, lambda: super(NormalizedTextListSerializer, self).update(instances, validated_data))
+
+
+class NormalizedTextSerializerMixin(object):
+    def update(self, instance, validated_data):
+        return save_unique_text(self.Meta.model, lambda: super(NormalizedTextSerializerMixin, self).update(instance, validated_data))
+
+
+class RecipeListSerializer(BulkListSerializer):
+    def create(self, validated_data):
+        return super(RecipeListSerializer, self).create(self.child.resolve_texts(validated_data))
+
+    def update(self, instances, validated_data):
+        return super(RecipeListSerializer, self).update(instances, self.child.resolve_texts(validated_data))
+
+
+class UserSerializer(SparseFieldsMixin, InstrumentedDataMixin, serializers.ModelSerializer):
     password = serializers.CharField(
         label='Password',
         required=False,
@@ -29,6 +218,7 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.User
         fields = ('id', 'first_name', 'last_name', 'email', 'username', 'password', 'password_confirmation', 'is_active', 'created', 'modified')
+        list_serializer_class = InstrumentedListSerializer
         # fields = '__all__'
         # extra_kwargs = {'password': {'write_only': True}}
 
@@ -63,37 +253,110 @@ class UserSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop('password_confirmation')
-        instance = models.User.objects.create(**validated_data)
-        instance.encrypt_password(password=validated_data.pop('password'))
-        instance.save()
-        return instance
+        # One INSERT with the hash already in place.
+        return models.User.objects.create(password=passwords.hash_password(validated_data.pop('password')), **validated_data)
 
     def update(self, instance, validated_data):
         instance.first_name = validated_data.get('first_name', instance.first_name)
         instance.last_name = validated_data.get('last_name', instance.last_name)
         instance.email = validated_data.get('email', instance.email)
         instance.username = validated_data.get('username', instance.username)
-        password = validated_data.get('password')
-        if password is not '':
-            instance.encrypt_password(password=validated_data.get('password', ''))
+        if validated_data.get('password'):
+            instance.encrypt_password(password=validated_data['password'])
         instance.is_active = validated_data.get('is_active', instance.is_active)
         instance.save()
         return instance
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(InstrumentedDataMixin, serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+    step_texts = serializers.ListField(
+        label='Steps (text)',
+        child=serializers.CharField(max_length=100),
+        required=False,
+        write_only=True,
+        help_text='Steps given by text; each one is matched to an existing step with the same normalized text, or created.',
+    )
+    ingredient_texts = serializers.ListField(
+        label='Ingredients (text)',
+        child=serializers.CharField(max_length=100),
+        required=False,
+        write_only=True,
+        help_text='Ingredients given by text; each one is matched to an existing ingredient with the same normalized text, or created.',
+    )
+
     class Meta:
         model = models.Recipe
-        fields = ('id', 'name', 'user', 'steps', 'ingredients')
+        fields = ('id', 'name', 'user', 'steps', 'ingredients', 'step_texts', 'ingredient_texts')
+        list_serializer_class = RecipeListSerializer
+
+    def resolve_texts(self, validated_data):
+        # step_texts/ingredient_texts of every item are resolved with one get_or_create_by_texts() call per model and appended to steps/ingredients.
+        validated_data = [dict(attrs) for attrs in validated_data]
+        for texts_name, name, model in (('step_texts', 'steps', models.Step), ('ingredient_texts', 'ingredients', models.Ingredient)):
+            texts = [text for attrs in validated_data for text in attrs.get(texts_name, [])]
+            if len(texts) == 0:
+                for attrs in validated_data:
+                    attrs.pop(texts_name, None)
+                continue
+            instances = iter(model.objects.get_or_create_by_texts(texts))
+            for attrs in validated_data:
+                if texts_name in attrs:
+                    attrs[name] = list(attrs.get(name, [])) + [next(instances) for text in attrs.pop(texts_name)]
+        return validated_data
+
+    # One transaction per write: the recipe row and its relations commit together, and the recipes_changed work runs once (see signals.py).
+    def create(self, validated_data):
+        with bulk.atomic_write():
+            return super(RecipeSerializer, self).create(self.resolve_texts([validated_data])[0])
+
+    def update(self, instance, validated_data):
+        with bulk.atomic_write():
+            return super(RecipeSerializer, self).update(instance, self.resolve_texts([validated_data])[0])
 
 
-class StepSerializer(serializers.ModelSerializer):
+class StepSerializer(SparseFieldsMixin, NormalizedTextSerializerMixin, InstrumentedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Step
         fields = ('id', 'step_text')
+        list_serializer_class = NormalizedTextListSerializer
+
+    def create(self, validated_data):
+        instance, created = models.Step.objects.get_or_create_by_text(validated_data['step_text'])
+        return instance
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(SparseFieldsMixin, NormalizedTextSerializerMixin, InstrumentedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Ingredient
         fields = ('id', 'text')
+        list_serializer_class = NormalizedTextListSerializer
+
+    def create(self, validated_data):
+        instance, created = models.Ingredient.objects.get_or_create_by_text(validated_data['text'])
+        return instance
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.User
+        fields = ('id', 'first_name', 'last_name', 'username')
+
+
+class RecipeReadSerializer(SparseFieldsMixin, InstrumentedDataMixin, serializers.ModelSerializer):
+    # Nested read-only representation; expects the queryset from Recipe.objects.get_recipes() so the relations come from select_related/prefetch_related.
+    user = UserSummarySerializer(read_only=True)
+    steps = StepSerializer(many=True, read_only=True)
+    ingredients = IngredientSerializer(many=True, read_only=True)
+    expandable_fields = ('user', 'steps', 'ingredients')
+
+    class Meta:
+        model = models.Recipe
+        fields = ('id', 'name', 'user', 'steps', 'ingredients')
+        list_serializer_class = InstrumentedListSerializer
+
+
+class ChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Change
+        fields = ('id', 'model_name', 'object_id', 'action', 'created')
@@ -0,0 +1,212 @@
+from django.db import router, transaction
+from django.db.models import signals
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from django.apps import apps
+from . import autocomplete, bulk, cache, changes, documents, fulltext, indexes, models, search
+
+# Sent whenever what a recipe is made of may have changed: its own row, its user, its steps/ingredients or the text of a linked step/ingredient.
+# fields names what changed ('name', 'user', 'steps', 'ingredients'); touched is true when the recipe rows were written already, Recipe.modified
+# (auto_now) included. Bulk code paths that bypass the model signals send it themselves, through send_recipes_changed(): inside a transaction
+# the changes are collected and sent once it commits.
+recipes_changed = Signal(providing_args=['recipe_ids', 'fields', 'touched'])
+
+RECIPE_FIELDS = ('name', 'user', 'steps', 'ingredients')
+
+RELATED_NAMES = {
+    models.Step: 'steps',
+    models.Ingredient: 'ingredients',
+    models.Recipe.steps.through: 'steps',
+    models.Recipe.ingredients.through: 'ingredients',
+}
+
+
+def send_recipes_changed(recipe_ids, fields, touched=False):
+    # Saving a recipe and setting its steps and ingredients in one transaction sends post_save and two m2m_changed: the receivers (touch,
+    # indexes, document, autocomplete, cache) run once per recipe when it commits, not once per signal. Outside a transaction, sent right away.
+    recipe_ids = set(recipe_ids)
+    if len(recipe_ids) == 0:
+        return
+    using = router.db_for_write(models.Recipe)
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        recipes_changed.send(sender=models.Recipe, recipe_ids=recipe_ids, fields=set(fields), touched=touched)
+        return
+    if getattr(connection, 'pending_recipe_changes', None) is None:
+        connection.pending_recipe_changes = {}
+    pending = connection.pending_recipe_changes
+    for pk in recipe_ids:
+        pending_fields, pending_touched = pending.get(pk, (frozenset(), False))
+        pending[pk] = (pending_fields | frozenset(fields), pending_touched or touched)
+    # One hook per call: the first to run sends everything, the others find nothing left. Hooks of a rolled back savepoint are dropped, their
+    # changes are sent with the rest (every receiver is idempotent).
+    transaction.on_commit(lambda: send_pending_recipes_changed(connection), using=using)
+
+
+def send_pending_recipes_changed(connection):
+    pending = getattr(connection, 'pending_recipe_changes', None)
+    connection.pending_recipe_changes = None
+    if not pending:
+        return
+    groups = {}
+    for pk, key in pending.items():
+        groups.setdefault(key, set()).add(pk)
+    for (fields, touched), recipe_ids in groups.items():
+        recipes_changed.send(sender=models.Recipe, recipe_ids=recipe_ids, fields=set(fields), touched=touched)
+
+
+def get_related_recipe_ids(instance, name):
+    return models.Recipe.objects.filter(**{name: instance}).order_by().values_list('pk', flat=True)
+
+
+def send_bulk_saved(model, pks, fields, created):
+    # What the post_save/m2m_changed receivers below would have sent for rows written with bulk INSERT/UPDATE.
+    if model in (models.Step, models.Ingredient, models.User):
+        autocomplete.items_saved(model, pks)
+    if model is models.Recipe:
+        # bulk_create() and bulk_update() write the auto_now timestamps.
+        send_recipes_changed(pks, fields, touched=True)
+    elif model in RELATED_NAMES and not created:
+        name = RELATED_NAMES[model]
+        for batch in bulk.chunks(pks):
+            send_recipes_changed(models.Recipe.objects.filter(**{name + '__in': batch}).order_by().values_list('pk', flat=True), (name,))
+
+
+@receiver(signals.post_save, sender=models.Recipe)
+def recipe_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Saving an instance loaded with deferred fields passes the attnames of the loaded ones ('user_id'): mapped back to field names.
+    fields = [models.Recipe._meta.get_field(name).name for name in update_fields or ('name', 'user', 'modified')]
+    send_recipes_changed([instance.pk], [name for name in fields if name != 'modified'], touched='modified' in fields)
+
+
+@receiver(signals.post_delete, sender=models.Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    send_recipes_changed([instance.pk], RECIPE_FIELDS)
+
+
+@receiver(signals.post_save, sender=models.User)
+def user_saved(sender, instance, created, **kwargs):
+    if not created:
+        send_recipes_changed(instance.recipe.order_by().values_list('pk', flat=True), ('user',))
+
+
+@receiver(signals.m2m_changed, sender=models.Recipe.steps.through)
+@receiver(signals.m2m_changed, sender=models.Recipe.ingredients.through)
+def recipe_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    name = RELATED_NAMES[sender]
+    if action == 'pre_clear' and reverse:
+        # The reverse side (step.recipe_set.clear()) gives no pk_set: remember the recipes before the rows go away.
+        instance._cleared_recipe_ids = list(get_related_recipe_ids(instance, name))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            recipe_ids = [instance.pk]
+        elif action == 'post_clear':
+            recipe_ids = getattr(instance, '_cleared_recipe_ids', ())
+        else:
+            recipe_ids = pk_set or ()
+        if action == 'post_clear' or pk_set:
+            changes.record(models.Recipe, recipe_ids, changes.UPDATE)
+        send_recipes_changed(recipe_ids, (name,))
+
+
+def related_saved(sender, instance, created, **kwargs):
+    if not created:
+        name = RELATED_NAMES[sender]
+        send_recipes_changed(get_related_recipe_ids(instance, name), (name,))
+
+
+def related_pre_delete(sender, instance, **kwargs):
+    name = RELATED_NAMES[sender]
+    instance._deleted_recipe_ids = list(get_related_recipe_ids(instance, name))
+
+
+def related_post_delete(sender, instance, **kwargs):
+    name = RELATED_NAMES[sender]
+    send_recipes_changed(getattr(instance, '_deleted_recipe_ids', ()), (name,))
+
+
+for related_model in (models.Step, models.Ingredient):
+    signals.post_save.connect(related_saved, sender=related_model)
+    signals.pre_delete.connect(related_pre_delete, sender=related_model)
+    signals.post_delete.connect(related_post_delete, sender=related_model)
+
+
+def autocomplete_item_saved(sender, instance, **kwargs):
+    autocomplete.item_saved(sender, instance)
+
+
+def autocomplete_item_deleted(sender, instance, **kwargs):
+    autocomplete.item_deleted(sender, instance.pk)
+
+
+for autocomplete_model in (models.Step, models.Ingredient, models.User):
+    signals.post_save.connect(autocomplete_item_saved, sender=autocomplete_model)
+    signals.post_delete.connect(autocomplete_item_deleted, sender=autocomplete_model)
+
+
+def log_saved(sender, instance, created, **kwargs):
+    changes.record(sender, [instance.pk], changes.CREATE if created else changes.UPDATE)
+
+
+def log_deleted(sender, instance, **kwargs):
+    changes.record(sender, [instance.pk], changes.DELETE)
+
+
+for logged_model in changes.MODEL_NAMES:
+    signals.post_save.connect(log_saved, sender=logged_model)
+    signals.post_delete.connect(log_deleted, sender=logged_model)
+
+
+@receiver(bulk.rows_written)
+def log_rows_written(sender, pks, created, **kwargs):
+    changes.record(sender, pks, changes.CREATE if created else changes.UPDATE)
+
+
+@receiver(recipes_changed)
+def touch_recipes(sender, recipe_ids, fields, touched=False, **kwargs):
+    # Recipe.modified also covers what a recipe embeds (user, steps, ingredients): it is what the ETag / Last-Modified validators are built from.
+    # A recipe save already wrote it, so it takes no second UPDATE.
+    if touched:
+        return
+    modified = timezone.now()
+    for batch in bulk.chunks(recipe_ids):
+        models.Recipe.objects.filter(pk__in=batch).update(modified=modified)
+
+
+@receiver(recipes_changed)
+def update_ingredient_index(sender, recipe_ids, fields, **kwargs):
+    if 'ingredients' in fields:
+        search.index_recipes(recipe_ids)
+
+
+@receiver(recipes_changed)
+def update_fulltext_index(sender, recipe_ids, fields, **kwargs):
+    if fields & {'name', 'steps', 'ingredients'}:
+        fulltext.index_recipes(recipe_ids)
+
+
+@receiver(recipes_changed)
+def update_autocomplete(sender, recipe_ids, fields, **kwargs):
+    autocomplete.recipes_changed(recipe_ids, fields)
+
+
+@receiver(recipes_changed)
+def update_documents(sender, recipe_ids, fields, **kwargs):
+    # In the request that made the change, after it commits: saving a step, ingredient or user rebuilds the documents of every recipe linking it.
+    documents.recipes_changed(recipe_ids)
+
+
+@receiver(recipes_changed)
+def invalidate_cache(sender, recipe_ids, fields, **kwargs):
+    cache.invalidate_recipes(recipe_ids, fields)
+
+
+@receiver(signals.post_migrate, sender=apps.get_app_config('genius_plaza'))
+def install_fulltext_index(sender, using, **kwargs):
+    # The FTS5 virtual table / tsvector table is not a model: created here, after every migrate.
+    fulltext.install(using)
+
+
+@receiver(signals.post_migrate, sender=apps.get_app_config('genius_plaza'))
+def install_indexes(sender, using, **kwargs):
+    indexes.install(using)
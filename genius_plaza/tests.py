@@ -0,0 +1,249 @@
+import io
+import json
+from unittest import mock
+from django.core.management import call_command
+from django.db import IntegrityError, connections, router, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from . import benchmarks, bulk, cache, fulltext, indexes, instrumentation, models, passwords, search, signals, views
+from .management.commands import explain_hot_queries
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # The serialized payloads are cached per process: every request below reads the database.
+        cache.get_cache().clear()
+
+    def get(self, url, **params):
+        cache.get_cache().clear()
+        response = self.client.get(url, params, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+class RecipeListQueriesTest(APITestCase):
+    # /recipe/ reads a page with the same number of queries whatever the number of recipes, steps and ingredients: no query per row.
+    url = reverse('genius-plaza:recipe-list')
+
+    def assertListQueries(self, recipes):
+        benchmarks.seed_recipes(recipes, users=3, steps=20, ingredients=20)
+        pages = {}
+        # With rows.RowReader (fast_read) and with RecipeReadSerializer over get_recipes() and its prefetches: the same queries, the same payload.
+        for fast_read in (True, False):
+            with self.subTest(fast_read=fast_read), mock.patch.object(views.RecipeListView, 'fast_read', fast_read):
+                # Validators (with the page count), the page, its steps and its ingredients.
+                with self.assertNumQueries(4):
+                    response = self.get(self.url, page_size=100)
+                self.assertEqual(len(response.json()['results']), min(recipes, 100))
+                # A cursor page can hold 500 rows: no aggregate, the page, its steps and its ingredients.
+                with self.assertNumQueries(3):
+                    response = self.get(self.url, pagination='cursor', page_size=500)
+                pages[fast_read] = response.json()['results']
+                self.assertEqual(len(pages[fast_read]), min(recipes, 500))
+        self.assertEqual(pages[True], pages[False])
+
+    def test_one_recipe(self):
+        self.assertListQueries(1)
+
+    def test_500_recipes(self):
+        self.assertListQueries(500)
+
+
+class RecipeSparseFieldsQueriesTest(APITestCase):
+    # ?fields= and ?expand= on /recipes/ read only what is shown: one query per relation shown, none for the others, whatever the page size.
+    url = reverse('genius-plaza:recipes-list')
+    variants = (
+        # Validators (with the page count), the page, its steps and its ingredients.
+        ('full', {}, 4),
+        ('sparse', {'fields': 'id,name'}, 2),
+        ('expanded', {'expand': 'user'}, 4),
+        ('sparse and expanded', {'fields': 'id,name,steps', 'expand': 'steps'}, 3),
+    )
+
+    def assertVariantQueries(self, recipes):
+        benchmarks.seed_recipes(recipes, users=3, steps=20, ingredients=20)
+        for label, params, queries in self.variants:
+            with self.subTest(label):
+                with self.assertNumQueries(queries):
+                    response = self.get(self.url, page_size=100, **params)
+                results = response.json()['results']
+                self.assertEqual(len(results), min(recipes, 100))
+                if 'fields' in params:
+                    self.assertEqual(list(results[0]), params['fields'].split(','))
+                if 'expand' in params:
+                    expanded = results[0][params['expand']]
+                    self.assertIsInstance(expanded[0] if isinstance(expanded, list) else expanded, dict)
+
+    def test_one_recipe(self):
+        self.assertVariantQueries(1)
+
+    def test_500_recipes(self):
+        self.assertVariantQueries(500)
+
+    def test_detail(self):
+        benchmarks.seed_recipes(1, users=1, steps=20, ingredients=20)
+        url = reverse('genius-plaza:recipes-detail', args=[models.Recipe.objects.get().pk])
+        # Validators and the recipe; expanding adds its steps and its ingredients.
+        with self.assertNumQueries(2):
+            self.assertEqual(list(self.get(url, fields='id,name').json()), ['id', 'name'])
+        with self.assertNumQueries(4):
+            self.get(url, expand='user,steps,ingredients')
+
+
+class RecipeWriteQueriesTest(TransactionTestCase):
+    # POST/PUT /recipes/ send post_save and an m2m_changed per relation: the recipes_changed work (ingredient and full-text indexes, document,
+    # cache) runs once, after the commit. A TransactionTestCase, so the commit hooks do run.
+    url = reverse('genius-plaza:recipes-list')
+
+    def setUp(self):
+        benchmarks.seed_recipes(10, users=2, steps=10, ingredients=10)
+        # Probed once per process on first use.
+        fulltext.get_backend()
+        self.user = models.User.objects.order_by('pk').first()
+        self.steps = list(models.Step.objects.order_by('pk').values_list('pk', flat=True))
+        self.ingredients = list(models.Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+        self.sent = []
+        signals.recipes_changed.connect(self.record, dispatch_uid='test-recipe-writes')
+        self.addCleanup(signals.recipes_changed.disconnect, dispatch_uid='test-recipe-writes')
+
+    def record(self, sender, recipe_ids, fields, **kwargs):
+        self.sent.append((sorted(recipe_ids), sorted(fields)))
+
+    def write(self, method, url, steps, ingredients, status):
+        body = {'name': 'Omelette', 'user': self.user.pk, 'steps': steps, 'ingredients': ingredients}
+        response = getattr(self.client, method)(url, json.dumps(body), content_type='application/json', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def test_create(self):
+        # Validation (6: user, steps, ingredients), the write (11: recipe and through rows with their change log), then once after the commit the
+        # ingredient index (4), the full-text index (6, in a transaction of its own) and the document (6), and the relations of the response (2).
+        with self.assertNumQueries(35):
+            recipe = self.write('post', self.url, self.steps[:3], self.ingredients[:2], 201)
+        self.assertEqual(self.sent, [([recipe['id']], ['ingredients', 'name', 'steps', 'user'])])
+
+    def test_update(self):
+        recipe = self.write('post', self.url, self.steps[:3], self.ingredients[:2], 201)
+        self.sent = []
+        url = reverse('genius-plaza:recipes-detail', args=[recipe['id']])
+        # As above, plus the instance read first (3) and the through rows removed (8 more for the write).
+        with self.assertNumQueries(44):
+            self.write('put', url, self.steps[3:5], self.ingredients[2:5], 200)
+        self.assertEqual(self.sent, [([recipe['id']], ['ingredients', 'name', 'steps', 'user'])])
+
+    def test_fulltext_document_written_once(self):
+        backend = fulltext.get_backend()
+        if backend is None:
+            self.skipTest('No full-text backend on this database.')
+        with CaptureQueriesContext(connections[router.db_for_write(models.Recipe)]) as queries:
+            recipe = self.write('post', self.url, self.steps[:3], self.ingredients[:2], 201)
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(len([query for query in sql if 'DELETE FROM %s ' % backend.table in query]), 1)
+        self.assertEqual(len([query for query in sql if 'INSERT INTO %s ' % backend.table in query]), 1)
+        self.assertEqual(list(fulltext.search_recipes(models.Recipe.objects.all(), 'Omelette').values_list('pk', flat=True)), [recipe['id']])
+
+
+class IngredientSearchTest(TestCase):
+    def test_prefix_term_counts_recipes_not_terms(self):
+        # 300 recipes match egg* through two terms (egg, eggs), 100 through one: 700 term rows, 400 recipes, fewer than RARE_TERM_RECIPES.
+        user = models.User.objects.create(username='search', email='search@example.com', password='!')
+        egg, eggs = models.Ingredient.objects.get_or_create_by_texts(['egg', 'eggs'])
+        recipes = bulk.bulk_create(models.Recipe, [models.Recipe(name='Recipe %s' % i, user=user) for i in range(400)])
+        bulk.bulk_add_m2m(models.Recipe, 'ingredients', [(recipe.pk, eggs.pk) for recipe in recipes] + [
+            (recipe.pk, egg.pk) for recipe in recipes[:300]
+        ])
+        search.index_recipes([recipe.pk for recipe in recipes])
+        self.assertLess(len(recipes), search.RARE_TERM_RECIPES)
+        self.assertEqual(search.filter_recipes(models.Recipe.objects.all(), 'egg*').count(), 400)
+
+
+class InstrumentationTest(TestCase):
+    def test_executemany_counts_as_one_query(self):
+        benchmarks.seed_recipes(1, users=1, steps=20, ingredients=20)
+        recipe = models.Recipe.objects.get()
+        threshold = instrumentation.get_setting('N_PLUS_ONE_THRESHOLD')
+        instrumentation.install(connections[router.db_for_write(models.RecipeIngredientTerm)])
+        stats = instrumentation.start()
+        try:
+            bulk.insert_rows(models.RecipeIngredientTerm, ['term', 'recipe'], [('term %s' % i, recipe.pk) for i in range(threshold * 2)])
+        finally:
+            instrumentation.stop()
+        self.assertEqual((stats.queries, stats.batch_rows), (1, threshold * 2))
+        self.assertEqual(stats.get_n_plus_one(threshold), [])
+
+
+class PasswordSchemesTest(TestCase):
+    # A django_bcrypt_sha256 hash, stored before its backend went missing.
+    bcrypt_hash = 'bcrypt_sha256$$2b$12$cm6w5/0AU8kj2M3J0z1Vte3Wb8U3uVIYI0mZbQ1UG8y6rhbDv0Dcu'
+
+    @override_settings(GENIUS_PLAZA_PASSWORD_HASHING={'SCHEMES': ('django_bcrypt_sha256', 'django_pbkdf2_sha256'), 'WORKERS': 0})
+    def test_scheme_without_backend_stays_in_the_context(self):
+        if 'django_bcrypt_sha256' in passwords.get_available_schemes(['django_bcrypt_sha256']):
+            self.skipTest('bcrypt is installed.')
+        passwords.reset_config()
+        self.addCleanup(passwords.reset_config)
+        self.assertEqual(passwords.get_config()[:2], (('django_bcrypt_sha256', 'django_pbkdf2_sha256'), 'django_pbkdf2_sha256'))
+        self.assertEqual(passwords.identify(self.bcrypt_hash), 'django_bcrypt_sha256')
+        self.assertEqual(passwords.identify(passwords.hash_password('password')), 'django_pbkdf2_sha256')
+
+
+class HotQueriesTest(TestCase):
+    # The lookups the API and the admin run on every request are answered from an index, on an empty database as on a full one (the plans
+    # come from the schema; see the explain_hot_queries command).
+    def test_hot_queries_use_an_index(self):
+        connection = connections[router.db_for_read(models.Recipe)]
+        for label, queryset in explain_hot_queries.get_hot_queries():
+            with self.subTest(label):
+                plan, problems = explain_hot_queries.explain(connection, queryset)
+                self.assertEqual(problems, [], '\n'.join(plan))
+
+
+class NormalizedTextUpgradeTest(TransactionTestCase):
+    # A database created before the normalized text columns: the migration adds them (nullable, no unique index) to the populated tables, then
+    # merge_duplicates merges the rows that normalize alike, fills the columns and adds the unique indexes.
+    texts = ['Salt', 'salt ', 'Pepper', 'Sea  SALT', 'sea salt']
+
+    def setUp(self):
+        self.connection = connections[router.db_for_write(models.Step)]
+        self.user = models.User.objects.create(username='upgrade', email='upgrade@example.com', password='!')
+        self.recipe = models.Recipe.objects.create(name='Upgrade', user=self.user)
+        with self.connection.schema_editor() as editor:
+            for model in (models.Step, models.Ingredient):
+                editor.remove_field(model, model.objects.get_normalized_field())
+        self.addCleanup(self.migrate)
+        quote = self.connection.ops.quote_name
+        with self.connection.cursor() as cursor:
+            for model in (models.Step, models.Ingredient):
+                source = model.objects.get_normalized_field().source
+                for text in self.texts:
+                    cursor.execute('INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+                        quote(model._meta.db_table), quote(source), quote('modified')
+                    ), [text, self.recipe.modified])
+        self.recipe.steps.set(models.Step.objects.values_list('pk', flat=True))
+        self.recipe.ingredients.set(models.Ingredient.objects.values_list('pk', flat=True))
+
+    def migrate(self):
+        # What makemigrations + migrate do to this schema: AddField, then the post_migrate indexes.
+        with self.connection.cursor() as cursor, self.connection.schema_editor() as editor:
+            for model in (models.Step, models.Ingredient):
+                field = model.objects.get_normalized_field()
+                columns = [column.name for column in self.connection.introspection.get_table_description(cursor, model._meta.db_table)]
+                if field.column not in columns:
+                    editor.add_field(model, field)
+        indexes.install(self.connection.alias)
+
+    def test_upgrade(self):
+        self.migrate()
+        call_command('merge_duplicates', stdout=io.StringIO())
+        for model in (models.Step, models.Ingredient):
+            with self.subTest(model._meta.model_name):
+                field = model.objects.get_normalized_field()
+                self.assertEqual(list(model.objects.order_by('pk').values_list(field.source, field.name)), [
+                    ('Salt', 'salt'), ('Pepper', 'pepper'), ('Sea  SALT', 'sea salt')
+                ])
+                self.assertEqual(sorted(getattr(self.recipe, model._meta.verbose_name_plural.lower()).values_list(field.name, flat=True)), [
+                    'pepper', 'salt', 'sea salt'
+                ])
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    model.objects.create(**{field.source: 'PEPPER'})
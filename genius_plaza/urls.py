@@ -11,10 +11,14 @@ router.register(r'ingredients', views.IngredientViewSet, 'ingredients')
 urlpatterns = [
     url(r'^', include(router.urls)),
     url(regex=r'^recipe/$', view=views.RecipeListView.as_view(), name='recipe-list'),
+    url(regex=r'^recipe/export/$', view=views.RecipeExportView.as_view(), name='recipe-export'),
     url(regex=r'^recipe/create/$', view=views.RecipeCreateView.as_view(), name='recipe-create'),
     url(regex=r'^recipe/(?P<pk>\d+)/$', view=views.RecipeDetailView.as_view(), name='recipe-detail'),
     url(regex=r'^recipe/(?P<pk>\d+)/update/$', view=views.RecipeUpdateView.as_view(), name='recipe-update'),
     url(regex=r'^recipe/(?P<pk>\d+)/delete/$', view=views.RecipeDeleteView.as_view(), name='recipe-delete'),
     url(regex=r'^recipe-by-user-pk/(?P<pk>\d+)/$', view=views.RecipeByUserPKView.as_view(), name='recipe-by-user-pk'),
     url(regex=r'^recipe-by-user-username/(?P<username>[a-z0-9_]+)/$', view=views.RecipeByUserUsernameView.as_view(), name='recipe-by-user-username'),
+    url(regex=r'^changes/$', view=views.ChangeFeedView.as_view(), name='changes'),
+    url(regex=r'^cache-stats/$', view=views.CacheStatsView.as_view(), name='cache-stats'),
+    url(regex=r'^metrics/$', view=views.MetricsView.as_view(), name='metrics'),
 ]
@@ -1,31 +1,388 @@
-from rest_framework import generics, viewsets
+import calendar
+import hashlib
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.encoding import force_bytes
+from django.utils.http import http_date
+from django.views.generic import View
+from rest_framework import exceptions, generics, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from . import models, serializers
+from rest_framework.views import APIView
+from . import autocomplete, bulk, cache, changes, documents, export, fieldsets, filters, instrumentation, models, pagination, renderers, rows, search, serializers
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class BulkModelMixin(object):
+    # POST/PUT/PATCH/DELETE <list>/bulk/ with a JSON list: validated with the viewset serializer, written in one transaction, errors reported per item.
+    bulk_max_size = 10000
+
+    def get_bulk_data(self, request):
+        data = request.data
+        if not isinstance(data, list):
+            return None, Response({'non_field_errors': ['Expected a list of items but got type "%s".' % type(data).__name__]}, status=status.HTTP_400_BAD_REQUEST)
+        if len(data) > self.bulk_max_size:
+            return None, Response({'non_field_errors': ['Ensure this list has no more than %s items.' % self.bulk_max_size]}, status=status.HTTP_400_BAD_REQUEST)
+        return data, None
+
+    def get_bulk_serializer(self, data, instances=None, partial=False):
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        context['related_objects'] = serializers.PrefetchedPrimaryKeyRelatedField.get_related_objects(serializer_class(context=context), data)
+        return serializer_class(instances, data=data, many=True, partial=partial, context=context)
+
+    def get_bulk_instances(self, data):
+        # [instance or None] aligned with data, and an error per item: every item must name an existing row by its id (5 or "5").
+        values = [item.get('id') if isinstance(item, dict) else item for item in data]
+        pks = [None if isinstance(value, bool) or not str(value).isdigit() else int(value) for value in values]
+        instances = bulk.in_bulk(self.get_queryset().model._default_manager.all(), [pk for pk in pks if pk is not None])
+        errors = []
+        for value, pk in zip(values, pks):
+            if pk is None:
+                errors.append({'id': ['Incorrect type. Expected pk value, received %s.' % type(value).__name__]})
+            elif pk not in instances:
+                errors.append({'id': ['Invalid pk "%s" - object does not exist.' % pk]})
+            else:
+                errors.append({})
+        return [instances.get(pk) for pk in pks], errors
+
+    @action(detail=False, methods=['post'], url_path='bulk', url_name='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        data, error_response = self.get_bulk_data(request)
+        if error_response is not None:
+            return error_response
+        serializer = self.get_bulk_serializer(data)
+        serializer.is_valid(raise_exception=True)
+        with bulk.atomic_write():
+            serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.put
+    def bulk_update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        data, error_response = self.get_bulk_data(request)
+        if error_response is not None:
+            return error_response
+        instances, errors = self.get_bulk_instances(data)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_bulk_serializer(data, instances=instances, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        with bulk.atomic_write():
+            serializer.save()
+        return Response(serializer.data)
+
+    @bulk_create.mapping.patch
+    def bulk_partial_update(self, request, *args, **kwargs):
+        kwargs['partial'] = True
+        return self.bulk_update(request, *args, **kwargs)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        data, error_response = self.get_bulk_data(request)
+        if error_response is not None:
+            return error_response
+        instances, errors = self.get_bulk_instances(data)
+        # As for updates, an id that does not exist fails the whole request and nothing is deleted.
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        pks = list(OrderedDict.fromkeys(instance.pk for instance in instances))
+        with bulk.atomic_write():
+            for batch in bulk.chunks(pks):
+                self.get_queryset().model._default_manager.filter(pk__in=batch).delete()
+        return Response({'deleted': pks})
+
+
+class ConditionalGetMixin(object):
+    # GET with If-None-Match / If-Modified-Since. Details and page-number lists take their validators from one aggregate (MAX(modified), COUNT(*)) over
+    # the indexed modified column, and a match is answered with 304 Not Modified before anything is serialized (or read from the cache). Cursor pages
+    # are there to avoid a COUNT(*) over the table: their ETag is a hash of the page itself.
+    modified_field = 'modified'
+
+    def get_conditional_aggregates(self):
+        return {}
+
+    def is_cursor_request(self):
+        paginator = self.paginator
+        if isinstance(paginator, pagination.PageNumberOrCursorPagination):
+            return paginator.is_cursor_request(self.request)
+        return isinstance(paginator, pagination.CursorPagination)
+
+    def get_conditional_response(self, request, queryset, allow_empty, get_response):
+        values = queryset.order_by().aggregate(last_modified=Max(self.modified_field), count=Count('pk'), **self.get_conditional_aggregates())
+        # The count doubles as the page-number paginator's (see pagination.PageNumberPagination): list() paginates this same queryset.
+        self.conditional_values = values
+        self.paginator_count = values['count']
+        if values['count'] == 0 and not allow_empty:
+            # Let the view answer (404 or an empty payload) without validators.
+            return get_response()
+        etag = quote_etag(hashlib.md5(force_bytes('%s|%s|%s|%s' % (
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            values['last_modified'].isoformat() if values['last_modified'] else '',
+            values['count'],
+        ))).hexdigest())
+        last_modified = calendar.timegm(values['last_modified'].utctimetuple()) if values['last_modified'] else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_content_conditional_response(self, request, get_response):
+        # The ETag of a response built first (or read from the cache): a match saves the client the download, not the server the page.
+        response = get_response()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        etag = quote_etag(hashlib.md5(
+            force_bytes('%s|%s|' % (request.get_full_path(), request.accepted_renderer.format)) + renderers.FastJSONRenderer().render(response.data)
+        ).hexdigest())
+        response = get_conditional_response(request, etag=etag) or response
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        get_response = lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        if self.is_cursor_request():
+            return self.get_content_conditional_response(request, get_response)
+        return self.get_conditional_response(request, self.filter_queryset(self.get_queryset()), True, get_response)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            # A value the field cannot hold (/users/abc/): not found, as get_object_or_404() would answer.
+            raise Http404
+        return self.get_conditional_response(request, queryset, False, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+
+class BatchRetrieveMixin(object):
+    # GET <list>/batch/?ids=3,1,2, or POST <list>/batch/ with [3, 1, 2] (or {"ids": [...]}) for long lists: the items in the order asked for, read with one
+    # IN query (plus the viewset's joins and one query per prefetched relation), and the ids that do not exist.
+    batch_max_size = bulk.BATCH_SIZE
+
+    def get_batch_ids(self, request):
+        if request.method == 'GET':
+            ids = request.query_params.get('ids', '')
+        else:
+            ids = request.data.get('ids') if isinstance(request.data, dict) else request.data
+        if isinstance(ids, str):
+            ids = [item.strip() for item in ids.split(',') if item.strip()]
+        if not isinstance(ids, list):
+            raise exceptions.ValidationError({'ids': ['Expected a list of ids but got type "%s".' % type(ids).__name__]})
+        if len(ids) == 0:
+            raise exceptions.ValidationError({'ids': ['Enter at least one id.']})
+        if len(ids) > self.batch_max_size:
+            raise exceptions.ValidationError({'ids': ['Ensure this list has no more than %s items.' % self.batch_max_size]})
+        invalid = [item for item in ids if isinstance(item, bool) or not str(item).isdigit()]
+        if invalid:
+            raise exceptions.ValidationError({'ids': ['"%s" is not a valid id.' % (item,) for item in invalid]})
+        # Repeated ids are answered once, at their first position.
+        return list(OrderedDict.fromkeys(int(item) for item in ids))
+
+    @action(detail=False, methods=['get', 'post'], url_path='batch', url_name='batch')
+    def batch(self, request, *args, **kwargs):
+        ids = self.get_batch_ids(request)
+        instances = dict((instance.pk, instance) for instance in self.get_queryset().filter(pk__in=ids).order_by())
+        return Response(OrderedDict([
+            ('results', self.get_serializer([instances[pk] for pk in ids if pk in instances], many=True).data),
+            ('missing', [pk for pk in ids if pk not in instances]),
+        ]))
+
+
+class SparseFieldsViewMixin(object):
+    # ?fields=id,name shows only those fields and ?expand=user,steps nests only those relations (the other ones shown come as pks) on reads.
+    # The query follows the fields: only() their columns, and a relation is joined or prefetched only when it is shown (see fieldsets.py).
+    sparse_actions = ('list', 'retrieve', 'search', 'batch')
+
+    def get_sparse_fields(self):
+        # (fields, expand) of the request, each None when not given; parsed once per request.
+        if getattr(self, 'sparse_fields', None) is None:
+            self.sparse_fields = (None, None)
+            if self.action in self.sparse_actions:
+                serializer_class = self.get_serializer_class()
+                serializer = serializer_class(context=self.get_serializer_context())
+                self.sparse_fields = (
+                    fieldsets.parse_names(self.request, fieldsets.FIELDS_PARAM, [field.field_name for field in serializer._readable_fields]),
+                    fieldsets.parse_names(self.request, fieldsets.EXPAND_PARAM, serializer_class.expandable_fields),
+                )
+        return self.sparse_fields
+
+    def is_sparse(self):
+        return self.get_sparse_fields() != (None, None)
+
+    def is_cacheable_object(self):
+        # The per-recipe cache entry holds the full representation only; sparse lists are cached under their own URL.
+        return not self.is_sparse()
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        if expand is not None:
+            kwargs.setdefault('expand', expand)
+        return super(SparseFieldsViewMixin, self).get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super(SparseFieldsViewMixin, self).get_queryset()
+        if not self.is_sparse():
+            return queryset
+        return fieldsets.shape_queryset(queryset, self.get_serializer())
+
+
+class FastReadMixin(object):
+    # list() with fast_read = True reads its rows with values() and builds them with rows.RowReader: the same output as the serializer, without a
+    # model instance and a to_representation() call per field and row. Serializers with fields values() cannot give fall back to the serializer.
+    fast_read = False
+
+    def get_row_reader(self):
+        if not self.fast_read:
+            return None
+        return rows.get_reader(self.get_serializer())
+
+    def list(self, request, *args, **kwargs):
+        reader = self.get_row_reader()
+        if reader is None:
+            return super(FastReadMixin, self).list(request, *args, **kwargs)
+        queryset = reader.get_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.read(page, queryset.db))
+        return Response(reader.read(queryset, queryset.db))
+
+
+class RecipeDocumentMixin(object):
+    # retrieve() answers from the recipe's stored document (see documents.py): one primary key lookup instead of the recipe, its user and both
+    # through tables. Recipes without a document yet and ?fields=/?expand= reads go through the serializer.
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        if documents.get_setting('ENABLED') and str(pk).isdigit() and self.is_cacheable_object():
+            document = documents.get_document(int(pk))
+            if document is not None:
+                return Response(document)
+        return super(RecipeDocumentMixin, self).retrieve(request, *args, **kwargs)
+
+
+class CachedResponseMixin(object):
+    # Read-through cache of serialized payloads: one entry per recipe, one per list page under the generations it depends on (see cache.invalidate_recipes()).
+    cache_generations = ('recipes',)
+
+    def is_cacheable_object(self):
+        return True
+
+    def get_cached_response(self, key, kind, build):
+        data, hit = cache.get_or_build(key, kind, build)
+        response = Response(data)
+        response[cache.HEADER] = 'HIT' if hit else 'MISS'
+        return response
+
+    def get_cache_generations(self):
+        return self.cache_generations
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            cache.list_key(request, self.get_cache_generations()), 'list',
+            lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs).data
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        if not str(pk).isdigit() or not self.is_cacheable_object():
+            return super(CachedResponseMixin, self).retrieve(request, *args, **kwargs)
+        return self.get_cached_response(
+            cache.recipe_key(int(pk)), 'recipe',
+            lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs).data
+        )
+
+
+class AutocompleteMixin(object):
+    # GET <list>/autocomplete/?q=tom&limit=10: items whose text starts with q (case and whitespace folded), most used in recipes first,
+    # answered from the in-process prefix index (see autocomplete.py) without a query.
+    autocomplete_index = None
+    autocomplete_field = None
+
+    @action(detail=False, methods=['get'], url_path='autocomplete', url_name='autocomplete')
+    def autocomplete(self, request, *args, **kwargs):
+        limit = request.query_params.get('limit')
+        if limit is not None and (not limit.isdigit() or int(limit) == 0):
+            raise exceptions.ValidationError({'limit': ['A positive integer is required.']})
+        suggestions = autocomplete.suggest(self.autocomplete_index, request.query_params.get('q', ''), int(limit) if limit else None)
+        return Response([
+            OrderedDict([('id', pk), (self.autocomplete_field, text), ('recipes', popularity)]) for pk, text, popularity in suggestions
+        ])
+
+
+class UserViewSet(SparseFieldsViewMixin, BatchRetrieveMixin, AutocompleteMixin, ConditionalGetMixin, FastReadMixin, viewsets.ModelViewSet):
     queryset = models.User.objects.all()
     serializer_class = serializers.UserSerializer
+    autocomplete_index = 'users'
+    fast_read = True
+    autocomplete_field = 'username'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = models.Recipe.objects.all()
+class RecipeViewSet(SparseFieldsViewMixin, BatchRetrieveMixin, ConditionalGetMixin, CachedResponseMixin, BulkModelMixin, FastReadMixin, RecipeDocumentMixin, viewsets.ModelViewSet):
+    queryset = models.Recipe.objects.get_recipes()
     serializer_class = serializers.RecipeSerializer
+    filter_backends = (filters.FullTextSearchFilter,)
+    fast_read = True
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve', 'search', 'batch'):
+            return serializers.RecipeReadSerializer
+        return serializers.RecipeSerializer
 
+    @action(detail=False, methods=['get'], url_path='search', url_name='search', pagination_class=pagination.CursorPagination)
+    def search(self, request, *args, **kwargs):
+        # ?q=eggs flour -milk, ?q=eggs OR butter, ?q=egg* over the ingredient inverted index; keyset pages only, a COUNT(*) would visit every match.
+        try:
+            queryset = search.filter_recipes(self.get_queryset(), request.query_params.get('q', ''))
+        except ValueError as exc:
+            raise exceptions.ValidationError({'q': [str(exc)]})
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
 
-class StepViewSet(viewsets.ModelViewSet):
+
+class StepViewSet(SparseFieldsViewMixin, BatchRetrieveMixin, AutocompleteMixin, ConditionalGetMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = models.Step.objects.all()
     serializer_class = serializers.StepSerializer
+    autocomplete_index = 'steps'
+    autocomplete_field = 'step_text'
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(SparseFieldsViewMixin, BatchRetrieveMixin, AutocompleteMixin, ConditionalGetMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = models.Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    autocomplete_index = 'ingredients'
+    autocomplete_field = 'text'
 
 
-class RecipeListView(generics.ListAPIView):
-    queryset = models.Recipe.objects.all()
-    serializer_class = serializers.RecipeSerializer
+class RecipeListView(ConditionalGetMixin, CachedResponseMixin, FastReadMixin, generics.ListAPIView):
+    queryset = models.Recipe.objects.get_recipes()
+    serializer_class = serializers.RecipeReadSerializer
+    fast_read = True
+
+
+class RecipeExportView(View):
+    # GET ?format=ndjson|csv: every recipe, streamed chunk by chunk with a bounded number of queries per chunk; memory does not grow with the catalog.
+    chunk_size = bulk.BATCH_SIZE
+
+    def get(self, request, *args, **kwargs):
+        format = request.GET.get('format', 'ndjson')
+        if format not in export.FORMATS:
+            # Plain text, not sniffed: the message echoes the query parameter, which must not be rendered as HTML.
+            response = HttpResponseBadRequest('Unknown format "%s"; use one of: %s.' % (format, ', '.join(export.FORMATS)), content_type='text/plain; charset=utf-8')
+            response['X-Content-Type-Options'] = 'nosniff'
+            return response
+        response = StreamingHttpResponse(export.export_recipes(format, chunk_size=self.chunk_size), content_type=export.CONTENT_TYPES[format])
+        response['Content-Disposition'] = 'attachment; filename="recipes.%s"' % format
+        return response
 
 
 class RecipeCreateView(generics.CreateAPIView):
@@ -33,9 +390,9 @@ class RecipeCreateView(generics.CreateAPIView):
     serializer_class = serializers.RecipeSerializer
 
 
-class RecipeDetailView(generics.RetrieveAPIView):
-    queryset = models.Recipe.objects.all()
-    serializer_class = serializers.RecipeSerializer
+class RecipeDetailView(ConditionalGetMixin, CachedResponseMixin, RecipeDocumentMixin, generics.RetrieveAPIView):
+    queryset = models.Recipe.objects.get_recipes()
+    serializer_class = serializers.RecipeReadSerializer
     lookup_field = 'pk'
 
 
@@ -51,23 +408,97 @@ class RecipeDeleteView(generics.DestroyAPIView):
     lookup_field = 'pk'
 
 
-class RecipeByUserPKView(generics.RetrieveAPIView):
-    queryset = models.User.objects.all()
-    serializer_class = serializers.UserSerializer
-    lookup_field = 'pk'
+class RecipeByUserView(ConditionalGetMixin, CachedResponseMixin, generics.ListAPIView):
+    # A user's recipes a page at a time, in two queries. Page-number pages take the validators, the page count and the user pk for the cache key
+    # from one aggregate; cursor pages skip it (see ConditionalGetMixin) and look the user up instead, as an empty result does (for its 404). The page
+    # is one query joined to the user that also reads each recipe's stored document (see documents.py): only recipes without one yet cost a third
+    # query, for their steps/ingredients.
+    serializer_class = serializers.RecipeReadSerializer
+    user_lookup_field = None
 
-    def retrieve(self, request, *args, **kwargs):
-        recipes = models.Recipe.objects.all().filter(user=self.get_object())
-        serializer = serializers.RecipeSerializer(recipes, many=True)
-        return Response(serializer.data)
+    def get_user_lookup(self):
+        return {self.user_lookup_field: self.kwargs[self.user_lookup_field]}
 
+    def get_queryset(self):
+        return models.Recipe.objects.get_recipes_by_user(with_document=documents.get_setting('ENABLED'), **self.get_user_lookup())
 
-class RecipeByUserUsernameView(generics.RetrieveAPIView):
-    queryset = models.User.objects.all()
-    serializer_class = serializers.UserSerializer
-    lookup_field = 'username'
+    def get_conditional_aggregates(self):
+        return {'user_pk': Max('user_id')}
 
-    def retrieve(self, request, *args, **kwargs):
-        recipes = models.Recipe.objects.all().filter(user=self.get_object())
-        serializer = serializers.RecipeSerializer(recipes, many=True)
-        return Response(serializer.data)
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.is_cursor_request():
+            return self.get_content_conditional_response(request, lambda: self.get_recipes_response(request, queryset, None))
+        return self.get_conditional_response(
+            request, queryset, False, lambda: self.get_recipes_response(request, queryset, self.conditional_values['user_pk'])
+        )
+
+    def get_recipes_response(self, request, queryset, user_pk):
+        if user_pk is None:
+            user_pk = models.User.objects.filter(**self.get_user_lookup()).values_list('pk', flat=True).first()
+            if user_pk is None:
+                raise Http404
+        return self.get_cached_response(
+            cache.list_key(request, ('users', cache.user_generation(user_pk))), 'user_recipes',
+            lambda: self.get_recipes_data(queryset)
+        )
+
+    def get_recipes_data(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_recipes_representation(page)).data
+        return self.get_recipes_representation(queryset)
+
+    def get_recipes_representation(self, recipes):
+        recipes = list(recipes)
+        stored = dict(
+            (recipe.pk, recipe.document) for recipe in recipes if 'document' not in recipe.get_deferred_fields() and recipe.document is not None
+        )
+        missing = [recipe for recipe in recipes if recipe.pk not in stored]
+        serialized = dict(zip(
+            [recipe.pk for recipe in missing], self.get_serializer(models.Recipe.objects.prefetch_steps_and_ingredients(missing), many=True).data
+        ))
+        with instrumentation.timer('serializer'):
+            return [documents.loads(stored[recipe.pk]) if recipe.pk in stored else serialized[recipe.pk] for recipe in recipes]
+
+
+class RecipeByUserPKView(RecipeByUserView):
+    user_lookup_field = 'pk'
+
+
+class RecipeByUserUsernameView(RecipeByUserView):
+    user_lookup_field = 'username'
+
+
+class ChangeFeedView(APIView):
+    # GET ?since=<cursor>&limit=100: what was created, updated or deleted after the cursor, oldest first; "next" is the cursor for the following call
+    # and "latest" the newest one. A mirror syncs by following "next" until has_more is false, for a cost proportional to the changes, not the catalog.
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since', '0')
+        if not since.isdigit():
+            raise exceptions.ValidationError({'since': ['A non-negative integer is required.']})
+        limit = request.query_params.get('limit')
+        if limit is not None and (not limit.isdigit() or int(limit) == 0):
+            raise exceptions.ValidationError({'limit': ['A positive integer is required.']})
+        limit = min(int(limit) if limit else changes.get_setting('LIMIT'), changes.get_setting('MAX_LIMIT'))
+        page, has_more = changes.get_changes(int(since), limit)
+        return Response(OrderedDict([
+            ('since', int(since)),
+            ('next', page[-1].pk if page else int(since)),
+            ('has_more', has_more),
+            ('latest', changes.get_latest()),
+            ('results', serializers.ChangeSerializer(page, many=True).data),
+        ]))
+
+
+class CacheStatsView(APIView):
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'backend': '%s.%s' % (type(cache.get_cache()).__module__, type(cache.get_cache()).__name__),
+            'stats': cache.get_stats(),
+        })
+
+
+class MetricsView(View):
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(instrumentation.metrics.render(), content_type=instrumentation.METRICS_CONTENT_TYPE)